@@ -0,0 +1,140 @@
+"""Deterministic synthetic libraries for benchmarks.
+
+The same seed and size always give the same database, so timings from different
+commits are comparable. Run from the project root to build one by hand:
+    python -m benchmarks.library 100k library.db
+"""
+import os
+import sys
+import random
+import sqlite3
+from itertools import accumulate
+from database import database
+from utils.constants import GENRES, LANGUAGES, RATINGS, TYPES
+
+SIZES = {"1k": 1_000, "100k": 100_000, "1m": 1_000_000}
+SHOWS_PER_BOOK = 0.25
+FIRST_YEAR, LAST_YEAR = 2015, 2026
+BATCH = 50_000  # Rows per executemany call
+
+# Title building blocks; roughly half the titles are Chinese or Japanese
+EN_WORDS = [
+    "Night", "River", "Garden", "Memory", "Silent", "Empire", "Letters", "Winter", "City",
+    "Light", "Journey", "Stranger", "History", "Ocean", "Secret", "Mountain", "Glass", "Time",
+]
+CJK_WORDS = [
+    "夜", "河流", "花園", "記憶", "沉默", "帝國", "書信", "冬天", "城市", "光", "旅程",
+    "陌生人", "歷史", "海洋", "秘密", "山", "玻璃", "時間", "の", "物語", "猫", "東京", "風",
+]
+NOTES = ["Audiobook", "Reread", "Kindle", "圖書館借閱", "Book club"]
+NOTE_RATE = 0.3          # Share of books and shows with a note; the rest are NULL
+UNKNOWN_MONTH_RATE = 0.05  # Share of entries saved with only a year (YYYY-00)
+
+
+def zipf_weights(n, s=1.1):
+    """Cumulative weights where the k-th item is about 1/k^s as likely as the first."""
+    return list(accumulate(1 / (rank ** s) for rank in range(1, n + 1)))
+
+def title(rng):
+    if rng.random() < 0.5:
+        return "".join(rng.sample(CJK_WORDS, rng.randint(2, 4)))
+    return " ".join(["The"] + rng.sample(EN_WORDS, rng.randint(1, 3)))
+
+def month_string(rng):
+    year = rng.randint(FIRST_YEAR, LAST_YEAR)
+    month = 0 if rng.random() < UNKNOWN_MONTH_RATE else rng.randint(1, 12)
+    return f"{year}-{month:02d}"
+
+def note(rng):
+    return rng.choice(NOTES) if rng.random() < NOTE_RATE else None
+
+def book_rows(count, rng):
+    """Yield (id, book row, translators) with skewed authors, genres, languages and ratings."""
+    authors = [f"Author {n:05d}" for n in range(max(50, count // 20))]
+    translators = [f"譯者 {n:04d}" for n in range(max(20, count // 100))]
+    author_weights = zipf_weights(len(authors))
+    genre_weights = zipf_weights(len(GENRES), 0.8)
+    language_weights = zipf_weights(len(LANGUAGES), 1.5)
+    rating_weights = zipf_weights(len(RATINGS), 0.5)
+
+    for book_id in range(1, count + 1):
+        language = rng.choices(LANGUAGES, cum_weights=language_weights)[0]
+        original = language if rng.random() < 0.6 else rng.choices(LANGUAGES, cum_weights=language_weights)[0]
+        row = (
+            book_id, title(rng), rng.choices(authors, cum_weights=author_weights)[0], month_string(rng),
+            language, original, rng.choices(GENRES, cum_weights=genre_weights)[0],
+            rng.choices(RATINGS, cum_weights=rating_weights)[0], note(rng),
+        )
+        # Translated books get one to three translators
+        names = rng.sample(translators, rng.choice([1, 1, 1, 2, 3])) if original != language else []
+        yield book_id, row, names
+
+def show_rows(count, rng):
+    type_weights = zipf_weights(len(TYPES), 0.7)
+    for show_id in range(1, count + 1):
+        name = title(rng)
+        if rng.random() < 0.3:
+            name = f"{name} - Season {rng.randint(1, 8)}"
+        yield (show_id, name, *database.split_season(name), month_string(rng),
+               rng.choices(TYPES, cum_weights=type_weights)[0], note(rng))
+
+def _batches(rows):
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= BATCH:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+def generate_library(path, books=1_000, shows=None, seed=0):
+    """Write a new database at path with books books and shows shows (default a quarter as many).
+
+    Rows are inserted before the indexes and full-text tables exist, which then build in one pass.
+    """
+    if shows is None:
+        shows = int(books * SHOWS_PER_BOOK)
+    if os.path.exists(path):
+        os.remove(path)
+
+    rng = random.Random(seed)
+    conn = sqlite3.connect(path)
+    try:
+        cursor = conn.cursor()
+        cursor.execute("PRAGMA journal_mode = WAL")
+        database.create_tables(cursor)
+        database.migrate(cursor)
+
+        for batch in _batches(book_rows(books, rng)):
+            cursor.executemany(
+                "INSERT INTO books (id, title, author, time, language, original_language, genre, rating, note)"
+                " VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                [row for _, row, _ in batch]
+            )
+            cursor.executemany(
+                "INSERT INTO translated (title_id, translator) VALUES (?, ?)",
+                [(book_id, name) for book_id, _, names in batch for name in names]
+            )
+        for batch in _batches(show_rows(shows, rng)):
+            cursor.executemany(
+                "INSERT INTO shows (id, title, series, season, time, type, note) VALUES (?, ?, ?, ?, ?, ?, ?)", batch
+            )
+
+        database.create_indexes(cursor)
+        database.create_fts(cursor)
+        database.create_rollups(cursor)
+        cursor.execute("ANALYZE")
+        conn.commit()
+    finally:
+        conn.close()
+    return path
+
+def main():
+    size = sys.argv[1] if len(sys.argv) > 1 else "1k"
+    path = sys.argv[2] if len(sys.argv) > 2 else f"library-{size}.db"
+    generate_library(path, SIZES[size])
+    print(f"Wrote {SIZES[size]} books to {path}")
+
+if __name__ == "__main__":
+    main()
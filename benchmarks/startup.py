@@ -0,0 +1,55 @@
+"""Measure how long the app's modules take to import, using python -X importtime.
+
+Run from the project root:  python -m benchmarks.startup [runs]
+"""
+import os
+import sys
+import statistics
+import subprocess
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# What opening each window imports, plus the report stack for comparison
+MODULES = ["main", "gui.menu_gui", "gui.book_gui", "gui.show_gui", "reporting.report"]
+RUNS = 5
+TOP = 5  # Slowest imports listed per module
+
+
+def import_times(module):
+    """Import module in a fresh interpreter and return {imported module: cumulative microseconds}."""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=BASE_DIR, capture_output=True, text=True, check=True
+    )
+    times = {}
+    # Lines look like "import time:   self [us] | cumulative | [indent]name"
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        times[name.strip()] = int(cumulative)
+    return times
+
+def measure(module, runs=RUNS):
+    """Median cumulative import time of module in milliseconds, and its slowest top-level imports."""
+    samples = [import_times(module) for _ in range(runs)]
+    total = statistics.median(sample[module] for sample in samples) / 1000
+    slowest = sorted(
+        ((name, us / 1000) for name, us in samples[-1].items() if name != module),
+        key=lambda item: item[1], reverse=True
+    )[:TOP]
+    return total, slowest
+
+def main():
+    runs = int(sys.argv[1]) if len(sys.argv) > 1 else RUNS
+    results = {}
+    for module in MODULES:
+        total, slowest = measure(module, runs)
+        results[module] = total
+        print(f"{module}: {total:.1f} ms (median of {runs})")
+        for name, ms in slowest:
+            print(f"    {name}: {ms:.1f} ms")
+    return results
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,196 @@
+"""Time the main database and reporting calls against a synthetic library.
+
+Run from the project root:
+    python -m benchmarks.suite [--size 1k|100k|1m] [--output results.json] [--compare old.json]
+
+Results are written as JSON (per benchmark: runs, min, median, p95 and mean in
+milliseconds, plus the commit and environment), so runs on different commits can be
+compared with --compare.
+"""
+import os
+import sys
+import json
+import time
+import shutil
+import sqlite3
+import argparse
+import platform
+import tempfile
+import statistics
+import subprocess
+from datetime import datetime
+from database import database, importer
+from benchmarks.library import SIZES, generate_library
+
+SEED = 0
+RUNS = 10
+SAVE_RUNS = 200
+REPORT_RUNS = 3
+DATA_DIR = os.path.join(tempfile.gettempdir(), "mymedia-benchmarks")
+
+# Search forms, as the GUI passes them: (title, author, year, month, lang, orig_lang, trans, genre, note, rating)
+BOOK_SEARCHES = {
+    "search_books(title)": ("記憶", "", "", "", "", "", "", "", "", ""),
+    "search_books(author, year)": ("", "Author 00001", "2023", "", "", "", "", "", "", ""),
+    "search_books(genre, rating)": ("", "", "", "", "", "", "", "Fiction", "", "Love"),
+    "search_books(translator)": ("", "", "", "", "", "", "譯者 0001", "", "", ""),
+    "search_books(translator, language)": ("", "", "", "", "Chinese", "", "譯者", "", "", ""),
+}
+NEW_BOOK = ("基準測試 Benchmark", "Author 00001", "2024", "5", "Chinese", "English", "譯者 0001 / 譯者 0002",
+            "Fiction", "", "Like")
+
+
+def library_path(size, seed=SEED):
+    """Path of the synthetic library for size, generated on first use and reused afterwards."""
+    os.makedirs(DATA_DIR, exist_ok=True)
+    path = os.path.join(DATA_DIR, f"library-{size}-seed{seed}.db")
+    if not os.path.exists(path):
+        print(f"Generating {size} library in {path}...")
+        generate_library(path, SIZES[size], seed=seed)
+    return path
+
+def timed(fn, runs):
+    """Call fn runs times and summarize the wall time in milliseconds."""
+    samples = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - start) * 1000)
+    samples.sort()
+    return {
+        "runs": runs,
+        "min_ms": round(samples[0], 3),
+        "median_ms": round(statistics.median(samples), 3),
+        "p95_ms": round(samples[min(runs - 1, int(runs * 0.95))], 3),
+        "mean_ms": round(statistics.fmean(samples), 3),
+    }
+
+def git_commit():
+    try:
+        result = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True)
+        return result.stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def import_into(path, books_csv):
+    """Import books_csv into a new, empty database at path."""
+    database.DB_PATH = path
+    database.init_db()
+    importer.import_books_csv(books_csv)
+
+def run_suite(size="1k", runs=RUNS, report=True):
+    """Run every benchmark against a scratch copy of the size library and return the results dict."""
+    work_dir = tempfile.mkdtemp(prefix="mymedia-bench-")
+    db_path = os.path.join(work_dir, "library.db")
+    shutil.copy(library_path(size), db_path)
+    database.DB_PATH = db_path  # get_connection reopens on the new path
+    database.init_db()
+    # Repeated runs would otherwise time the result cache, not the queries
+    database.set_result_cache(False)
+
+    results = {}
+    try:
+        results["save_book"] = timed(lambda: database.save_book(NEW_BOOK), SAVE_RUNS)
+        for name, form in BOOK_SEARCHES.items():
+            results[name] = timed(lambda: database.search_books(form), runs)
+        results["get_books(all)"] = timed(lambda: database.get_books("all"), runs)
+        results["get_books(view)"] = timed(lambda: database.get_books("view"), runs)
+        results["books_pager(view).first"] = timed(lambda: database.books_pager("view").first(), runs)
+
+        # The same calls answered by the result cache, after one run to fill it
+        database.set_result_cache(True)
+        database.search_books(BOOK_SEARCHES["search_books(title)"])
+        database.get_books("all")
+        results["search_books(title, cached)"] = timed(
+            lambda: database.search_books(BOOK_SEARCHES["search_books(title)"]), runs
+        )
+        results["get_books(all, cached)"] = timed(lambda: database.get_books("all"), runs)
+        database.set_result_cache(False)
+        books_csv, shows_csv = os.path.join(work_dir, "READ.csv"), os.path.join(work_dir, "WATCHED.csv")
+        results["export_as_csv"] = timed(lambda: database.export_as_csv(books_csv, shows_csv), min(runs, 3))
+        results["export_as_csv(gzip)"] = timed(
+            lambda: database.export_as_csv(books_csv, shows_csv, compress=True), min(runs, 3)
+        )
+
+        results["import_books_csv"] = timed(lambda: import_into(os.path.join(work_dir, "import.db"), books_csv), 1)
+        database.DB_PATH = db_path
+
+        if report:
+            results.update(report_benchmarks(work_dir))
+    finally:
+        database.close_all_connections()
+        database.set_result_cache(database.RESULT_CACHE)
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    with sqlite3.connect(library_path(size)) as conn:
+        rows = {table: conn.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+                for table in ("books", "translated", "shows")}
+    return {
+        "commit": git_commit(),
+        "timestamp": datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "sqlite": sqlite3.sqlite_version,
+        "platform": platform.platform(),
+        "size": size,
+        "seed": SEED,
+        "rows": rows,
+        "results": results,
+    }
+
+def report_benchmarks(work_dir):
+    """Time generate_report with both backends, with a cold and then a warm plot cache."""
+    from reporting import plot, report
+    plot.PLOT_CACHE_DIR = os.path.join(work_dir, "plot-cache")
+    report.REPORTS_DIR = os.path.join(work_dir, "reports")
+    report.shutdown_pool()  # get_pool hands the scratch cache directory to the workers it starts
+
+    def sql_report():
+        report.generate_report(counts=database.get_report_counts(since=report.DATA_SINCE))
+
+    def pandas_report():
+        report.generate_report(database.get_books("all"))
+
+    results = {}
+    results["generate_report(sql, cold cache)"] = timed(sql_report, 1)
+    results["generate_report(sql, warm cache)"] = timed(sql_report, REPORT_RUNS)
+    shutil.rmtree(plot.PLOT_CACHE_DIR, ignore_errors=True)
+    results["generate_report(pandas, cold cache)"] = timed(pandas_report, 1)
+    results["generate_report(pandas, warm cache)"] = timed(pandas_report, REPORT_RUNS)
+    results["get_report_counts"] = timed(lambda: database.get_report_counts(since=report.DATA_SINCE), RUNS)
+    report.shutdown_pool()
+    return results
+
+def compare(old, new):
+    """Print the median of every benchmark in new against old."""
+    print(f"\n{'benchmark':<40} {old.get('commit') or 'old':>10} {new.get('commit') or 'new':>10}  change")
+    for name, result in new["results"].items():
+        before = old["results"].get(name)
+        if before is None:
+            print(f"{name:<40} {'-':>10} {result['median_ms']:>10.2f}")
+            continue
+        change = (result["median_ms"] / before["median_ms"] - 1) * 100 if before["median_ms"] else 0
+        print(f"{name:<40} {before['median_ms']:>10.2f} {result['median_ms']:>10.2f}  {change:+.0f}%")
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark database and report calls.")
+    parser.add_argument("--size", choices=list(SIZES), default="1k")
+    parser.add_argument("--runs", type=int, default=RUNS)
+    parser.add_argument("--no-report", action="store_true", help="skip generate_report")
+    parser.add_argument("--output", help="JSON file to write (default bench-<size>-<commit>.json)")
+    parser.add_argument("--compare", help="earlier JSON results to compare against")
+    args = parser.parse_args()
+
+    results = run_suite(args.size, args.runs, report=not args.no_report)
+    output = args.output or f"bench-{args.size}-{results['commit'] or 'local'}.json"
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(results, f, indent=2, ensure_ascii=False)
+
+    for name, result in results["results"].items():
+        print(f"{name:<40} median {result['median_ms']:>10.2f} ms  p95 {result['p95_ms']:>10.2f} ms")
+    print(f"Results written to {output}")
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            compare(json.load(f), results)
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,156 @@
+"""Import books from a Calibre library's metadata.db.
+
+The Calibre database is attached read-only and copied with a few INSERT ... SELECT
+statements, so no book passes through Python. Each of our books columns is filled by
+an SQL expression over the Calibre book "b" (calibre.books) in CALIBRE_MAPPING; pass
+a dict to import_calibre_library to replace any of them, for example to take the
+reading date from a custom column:
+    {"time": "(SELECT strftime('%Y-%m', value) FROM calibre.custom_column_3 WHERE book = b.id)"}
+
+Books whose title and author are already in the database are skipped, and so are
+later copies of a title and author the Calibre library holds more than once.
+"""
+import os
+from urllib.request import pathname2url
+from database import database
+from database.importer import bulk_load, next_id, worth_deferring
+from utils import instrument
+from utils.constants import GENRES
+
+# Calibre stores ISO 639-2 codes; anything not listed becomes "Others"
+CALIBRE_LANGUAGES = {
+    "eng": "English", "zho": "Chinese", "chi": "Chinese", "fra": "French", "fre": "French",
+    "jpn": "Japanese", "kor": "Korean", "rus": "Russian", "deu": "German", "ger": "German",
+    "heb": "Hebrew", "spa": "Spanish", "nld": "Dutch", "dut": "Dutch", "swe": "Swedish",
+}
+
+FIRST_LANGUAGE = """coalesce((
+    SELECT n.name FROM calibre.books_languages_link l
+    JOIN calibre.languages lang ON lang.id = l.lang_code
+    JOIN temp.calibre_language_names n ON n.code = lang.lang_code
+    WHERE l.book = b.id ORDER BY l.item_order LIMIT 1
+), 'Others')"""
+
+CALIBRE_MAPPING = {
+    "title": "b.title",
+    "author": """coalesce((
+        SELECT a.name FROM calibre.books_authors_link l JOIN calibre.authors a ON a.id = l.author
+        WHERE l.book = b.id ORDER BY l.id LIMIT 1
+    ), 'Unknown')""",
+    # When the book was added to Calibre; Calibre has no reading date of its own
+    "time": "coalesce(strftime('%Y-%m', b.timestamp), strftime('%Y-%m', 'now'))",
+    "language": FIRST_LANGUAGE,
+    "original_language": FIRST_LANGUAGE,
+    # The first tag that is one of our genres
+    "genre": """coalesce((
+        SELECT g.name FROM calibre.books_tags_link l
+        JOIN calibre.tags t ON t.id = l.tag
+        JOIN temp.calibre_genres g ON g.name = t.name
+        WHERE l.book = b.id ORDER BY l.id LIMIT 1
+    ), 'Others')""",
+    # Calibre rates 0 to 10 (half stars); unrated books count as Fine
+    "rating": """coalesce((
+        SELECT CASE WHEN r.rating >= 9 THEN 'Love' WHEN r.rating >= 7 THEN 'Like'
+                    WHEN r.rating >= 5 THEN 'Fine' WHEN r.rating > 0 THEN 'Meh' END
+        FROM calibre.books_ratings_link l JOIN calibre.ratings r ON r.id = l.rating
+        WHERE l.book = b.id
+    ), 'Fine')""",
+    "note": "NULL",
+}
+
+# A query giving translators as rows with a Calibre book id column "book" and a name
+# column "translator"; None imports no translators.
+# Libraries that list translators as extra authors can use EXTRA_AUTHORS_AS_TRANSLATORS.
+CALIBRE_TRANSLATORS = None
+EXTRA_AUTHORS_AS_TRANSLATORS = """
+    SELECT l.book AS book, a.name AS translator FROM calibre.books_authors_link l JOIN calibre.authors a ON a.id = l.author
+    WHERE l.id > (SELECT min(first.id) FROM calibre.books_authors_link first WHERE first.book = l.book)
+    ORDER BY l.book, l.id
+"""
+
+BOOK_COLUMNS = ["title", "author", "time", "language", "original_language", "genre", "rating", "note"]
+
+
+def create_lookup_tables(cursor):
+    """Temporary tables the mapping expressions join against."""
+    cursor.execute("CREATE TEMP TABLE IF NOT EXISTS calibre_language_names (code TEXT PRIMARY KEY, name TEXT)")
+    cursor.execute("CREATE TEMP TABLE IF NOT EXISTS calibre_genres (name TEXT PRIMARY KEY COLLATE NOCASE)")
+    cursor.executemany("INSERT OR REPLACE INTO temp.calibre_language_names VALUES (?, ?)", CALIBRE_LANGUAGES.items())
+    cursor.executemany("INSERT OR REPLACE INTO temp.calibre_genres VALUES (?)", [(genre,) for genre in GENRES])
+    cursor.execute(f"""
+        CREATE TEMP TABLE IF NOT EXISTS calibre_import (
+            book_id INTEGER PRIMARY KEY, calibre_id INTEGER UNIQUE, {", ".join(BOOK_COLUMNS)}
+        )
+    """)
+    cursor.execute("DELETE FROM temp.calibre_import")
+
+def stage_books(cursor, expressions):
+    """Fill temp.calibre_import with the Calibre books to import, book_id numbering them from 1.
+
+    Runs before bulk_load drops the indexes, so the check against our books seeks
+    idx_books_author. Returns (books staged, books in the Calibre library).
+    """
+    cursor.execute(f"""
+        INSERT INTO temp.calibre_import (book_id, calibre_id, {", ".join(BOOK_COLUMNS)})
+        SELECT row_number() OVER (ORDER BY c.calibre_id), c.calibre_id, {", ".join(f"c.{column}" for column in BOOK_COLUMNS)}
+        FROM (
+            SELECT x.*, row_number() OVER (PARTITION BY x.title, x.author ORDER BY x.calibre_id) AS copy
+            FROM (
+                SELECT b.id AS calibre_id, {", ".join(f"{expressions[column]} AS {column}" for column in BOOK_COLUMNS)}
+                FROM calibre.books b
+            ) x
+        ) c
+        WHERE c.copy = 1
+          AND NOT EXISTS (SELECT 1 FROM main.books m WHERE m.author = c.author AND m.title = c.title)
+    """)
+    staged = cursor.execute("SELECT COUNT(*) FROM temp.calibre_import").fetchone()[0]
+    total = cursor.execute("SELECT COUNT(*) FROM calibre.books").fetchone()[0]
+    return staged, total
+
+@instrument.traced("calibre.import_calibre_library", measure=lambda counts: (counts[0], None))
+def import_calibre_library(path, mapping = None, translators = CALIBRE_TRANSLATORS, defer_indexes = None):
+    """Copy the books of the Calibre metadata.db at path (or of the library folder holding it).
+
+    mapping overrides entries of CALIBRE_MAPPING; translators is a query like
+    CALIBRE_TRANSLATORS. defer_indexes is passed to bulk_load; None decides by how many
+    books are new, as for CSV imports. Returns (books imported, books skipped as duplicates).
+    """
+    if os.path.isdir(path):
+        path = os.path.join(path, "metadata.db")
+    if not os.path.isfile(path):
+        raise FileNotFoundError(f"No Calibre library at {path}")
+    expressions = {**CALIBRE_MAPPING, **(mapping or {})}
+    unknown = set(expressions) - set(BOOK_COLUMNS)
+    if unknown:
+        raise ValueError(f"Unknown book columns: {', '.join(sorted(unknown))}")
+
+    # A connection of its own: attaching with mode=ro needs URI filenames, and ATTACH
+    # cannot run inside the transaction bulk_load opens
+    conn = database.open_connection(uri=True)
+    try:
+        conn.execute("ATTACH DATABASE ? AS calibre", (f"file:{pathname2url(os.path.abspath(path))}?mode=ro",))
+        database.flush_writes()  # Queued saves count as books we already have
+        with conn:
+            cursor = conn.cursor()
+            create_lookup_tables(cursor)
+            imported, total = stage_books(cursor, expressions)
+        if defer_indexes is None:
+            defer_indexes = worth_deferring("books", imported)
+
+        with bulk_load(("books", "translated"), defer_indexes, conn) as cursor:
+            first_id = next_id(cursor, "books")
+            cursor.execute(f"""
+                INSERT INTO books (id, {", ".join(BOOK_COLUMNS)})
+                SELECT ? + book_id - 1, {", ".join(BOOK_COLUMNS)} FROM temp.calibre_import ORDER BY book_id
+            """, (first_id,))
+            if translators:
+                cursor.execute(f"""
+                    INSERT INTO translated (title_id, translator)
+                    SELECT ? + i.book_id - 1, t.translator
+                    FROM ({translators}) t
+                    JOIN temp.calibre_import i ON i.calibre_id = t.book
+                """, (first_id,))
+        conn.execute("DETACH DATABASE calibre")
+    finally:
+        conn.close()
+    return imported, total - imported
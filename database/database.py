@@ -1,9 +1,15 @@
 import sqlite3
 import os
+import re
 import sys
 import csv
+import gzip
+import time
+import atexit
+import threading
+from collections import OrderedDict
 from datetime import datetime
-from utils import validation
+from utils import instrument, validation
 
 
 def get_base_dir():
@@ -17,64 +23,959 @@ def get_base_dir():
 BASE_DIR = get_base_dir()
 DB_PATH = os.path.join(BASE_DIR, "MEDIA.db")
 
+# Applied once to every connection opened by get_connection()
+PRAGMAS = [
+    ("journal_mode", "WAL"),
+    ("synchronous", "NORMAL"),   # Safe with WAL, skips the fsync on every commit
+    ("foreign_keys", "ON"),
+    ("mmap_size", 268435456),    # 256 MB
+    ("cache_size", -65536),      # Negative means KiB, i.e. 64 MB of page cache
+    ("temp_store", "MEMORY"),
+    ("busy_timeout", 5000),      # Milliseconds to wait on a locked database
+]
+
+_local = threading.local()
+_connections = []
+_connections_lock = threading.Lock()
+_generation = 0  # Bumped by close_all_connections() so threads know to reconnect
+
+def get_connection():
+    """Return the calling thread's connection, opening and tuning it on first use.
+
+    The connection stays open for the life of the thread so the page cache survives
+    between calls. Use it as a context manager to commit (or roll back) a transaction.
+    """
+    conn = getattr(_local, "conn", None)
+    if conn is not None and _local.path == DB_PATH and _local.generation == _generation:
+        return conn
+    if conn is not None:
+        # DB_PATH was changed, or every connection was closed, since this thread connected
+        close_connection()
+
+    conn = open_connection()
+    _local.conn, _local.path, _local.generation = conn, DB_PATH, _generation
+    with _connections_lock:
+        _connections.append(conn)
+    return conn
+
+def open_connection(uri = False):
+    """Open a new, tuned connection to DB_PATH that the caller closes.
+
+    uri allows "file:" URIs in ATTACH, e.g. to attach another database read-only.
+    """
+    conn = sqlite3.connect(DB_PATH, check_same_thread=False, uri=uri)
+    for name, value in PRAGMAS:
+        conn.execute(f"PRAGMA {name} = {value}")
+    return conn
+
+def close_connection():
+    """Close the calling thread's connection, if it has one."""
+    conn = getattr(_local, "conn", None)
+    if conn is None:
+        return
+    _local.conn = None
+    with _connections_lock:
+        if conn not in _connections:
+            return  # Already closed by close_all_connections()
+        _connections.remove(conn)
+    conn.close()
+
+def close_all_connections():
+    """Close every connection opened by get_connection(), e.g. on application exit.
+
+    Saves waiting in the write-behind queue are committed first.
+    """
+    global _generation
+    try:
+        if _write_queue is not None:
+            _write_queue.close()
+    finally:
+        if _result_cache is not None:
+            _result_cache.close()
+        with _connections_lock:
+            connections = _connections[:]
+            _connections.clear()
+            _generation += 1
+        for conn in connections:
+            conn.close()
+
+# Write-behind queue for save_book and save_show, off unless MYMEDIA_GROUP_COMMIT=1
+# or set_group_commit(True). Saves then return at once and are committed together.
+GROUP_COMMIT = os.environ.get("MYMEDIA_GROUP_COMMIT", "0") == "1"
+GROUP_COMMIT_SIZE = 200    # Saves committed in one transaction at most
+GROUP_COMMIT_DELAY = 1.0   # Seconds a save may wait for others before it is committed
+
+class WriteQueue:
+    """Collect writes and commit them, in order, in as few transactions as possible.
+
+    A write is a function taking a cursor. Waiting writes are committed when max_size
+    of them have piled up, max_delay seconds after the first one, or on flush().
+    They go through a connection of the queue's own, so any thread may flush. Errors
+    of writes that fail are kept in failures rather than raised by whoever flushed.
+    """
+    def __init__(self, max_size = GROUP_COMMIT_SIZE, max_delay = GROUP_COMMIT_DELAY):
+        self.max_size, self.max_delay = max_size, max_delay
+        self.pending = []
+        self.timer = None
+        self.failures = []  # Errors of writes that could not be committed, oldest first
+        self.conn, self.path = None, None
+        self.lock = threading.Lock()        # Guards pending and timer
+        self.flush_lock = threading.Lock()  # One flush at a time, so writes commit in order
+
+    def put(self, write):
+        with self.lock:
+            self.pending.append(write)
+            full = len(self.pending) >= self.max_size
+            if not full and self.timer is None:
+                self.timer = threading.Timer(self.max_delay, self._flush_on_timer)
+                self.timer.daemon = True
+                self.timer.start()
+        if full:
+            self.flush()
+
+    def flush(self):
+        """Commit every waiting write now and return how many there were.
+
+        A write that fails is left out and its error added to failures; the others
+        are committed regardless.
+        """
+        with self.flush_lock:
+            with self.lock:
+                batch, self.pending = self.pending, []
+                if self.timer is not None:
+                    self.timer.cancel()
+                    self.timer = None
+            if batch:
+                self.failures.extend(self._commit(batch))
+        return len(batch)
+
+    def take_failures(self):
+        """Return the errors kept so far and forget them."""
+        with self.flush_lock:
+            failures, self.failures = self.failures, []
+        return failures
+
+    def close(self):
+        """Flush, close the queue's connection, and raise the first failure nobody has taken."""
+        try:
+            self.flush()
+        finally:
+            with self.flush_lock:
+                if self.conn is not None:
+                    self.conn.close()
+                    self.conn = None
+        failures = self.take_failures()
+        if failures:
+            raise failures[0]
+
+    def _flush_on_timer(self):
+        self.flush()
+
+    def _commit(self, batch):
+        if self.conn is None or self.path != DB_PATH:
+            if self.conn is not None:
+                self.conn.close()
+            self.conn, self.path = open_connection(), DB_PATH
+        started = time.perf_counter()
+        errors = []
+        try:
+            with self.conn:
+                cursor = self.conn.cursor()
+                for write in batch:
+                    write(cursor)
+        except sqlite3.Error:
+            # Commit the rest one by one, so one bad save does not take the others with it
+            for write in batch:
+                try:
+                    with self.conn:
+                        write(self.conn.cursor())
+                except sqlite3.Error as e:
+                    errors.append(e)
+        instrument.record("database.group_commit", (time.perf_counter() - started) * 1000, rows=len(batch),
+                          error=repr(errors[0]) if errors else None)
+        return errors
+
+_write_queue = None
+
+def set_group_commit(enabled, max_size = GROUP_COMMIT_SIZE, max_delay = GROUP_COMMIT_DELAY):
+    """Turn the write-behind queue for save_book and save_show on or off.
+
+    Reads in this module flush the queue first, so callers always see their own
+    saves. Turning the queue off commits what is waiting.
+    """
+    global _write_queue
+    try:
+        if _write_queue is not None:
+            _write_queue.close()  # Raises a failure nobody took
+    finally:
+        # Switch even then, so the caller's setting holds whatever close() raised
+        _write_queue = WriteQueue(max_size, max_delay) if enabled else None
+
+def flush_writes(check = False):
+    """Commit saves waiting in the write-behind queue, if it is on. Returns how many.
+
+    A save that fails does not fail the caller, which is often a read that only
+    flushes to see the saves. Its error is kept until check=True raises the first
+    one kept (and forgets them all), for the side that saved to report.
+    """
+    queue = _write_queue
+    if queue is None:
+        return 0
+    count = queue.flush()
+    failures = queue.take_failures() if check else []
+    if failures:
+        raise failures[0]
+    return count
+
+if GROUP_COMMIT:
+    set_group_commit(True)
+atexit.register(flush_writes)
+
+# Results of read queries are kept until something commits to the database.
+# MYMEDIA_RESULT_CACHE=0 or set_result_cache(False) turns the cache off.
+RESULT_CACHE = os.environ.get("MYMEDIA_RESULT_CACHE", "1") != "0"
+RESULT_CACHE_BYTES = 64 * 1024 * 1024  # Estimated size of the rows kept, at most
+SIZE_SAMPLE = 100  # Rows measured to estimate the size of a result
+
+def estimate_size(rows):
+    """Rough bytes held by a list of row tuples, measured on the first SIZE_SAMPLE rows."""
+    sample = rows[:SIZE_SAMPLE]
+    if not sample:
+        return sys.getsizeof(rows)
+    per_row = sum(sys.getsizeof(row) + sum(sys.getsizeof(value) for value in row) for row in sample) / len(sample)
+    return sys.getsizeof(rows) + int(per_row * len(rows))
+
+class ResultCache:
+    """LRU cache of fetchall() results keyed on (sql, params), bounded by estimated size.
+
+    A connection of its own watches PRAGMA data_version, which changes whenever any
+    other connection commits: this process's threads, the write-behind queue, an
+    import, or another program. The whole cache is dropped then, so a lookup costs
+    one PRAGMA while nothing changes.
+    """
+    def __init__(self, max_bytes = RESULT_CACHE_BYTES):
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict()  # key: (rows, size), least recently used first
+        self.size = 0
+        self.version = None
+        self.watcher = None
+        self.hits = self.misses = 0
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        """Return (rows or None, version); pass the version back to put()."""
+        with self.lock:
+            version = self._current_version()
+            if version != self.version:
+                self.entries.clear()
+                self.size = 0
+                self.version = version
+            entry = self.entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None, version
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return entry[0], version
+
+    def put(self, key, version, rows):
+        """Keep rows read at version, unless the database has changed since."""
+        size = estimate_size(rows)
+        if size > self.max_bytes:
+            return
+        with self.lock:
+            if version != self.version or key in self.entries:
+                return
+            self.entries[key] = (rows, size)
+            self.size += size
+            while self.size > self.max_bytes:
+                _, (_, dropped) = self.entries.popitem(last=False)
+                self.size -= dropped
+
+    def close(self):
+        with self.lock:
+            self.entries.clear()
+            self.size = 0
+            self.version = None
+            if self.watcher is not None:
+                self.watcher.close()
+                self.watcher = None
+
+    def _current_version(self):
+        if self.watcher is None or self.version is None or self.version[:2] != (DB_PATH, _generation):
+            if self.watcher is not None:
+                self.watcher.close()
+            self.watcher = sqlite3.connect(DB_PATH, check_same_thread=False)
+        return (DB_PATH, _generation, self.watcher.execute("PRAGMA data_version").fetchone()[0])
+
+_result_cache = None
+
+def set_result_cache(enabled, max_bytes = RESULT_CACHE_BYTES):
+    """Turn the result cache used by fetch_all on or off, starting empty."""
+    global _result_cache
+    if _result_cache is not None:
+        _result_cache.close()
+    _result_cache = ResultCache(max_bytes) if enabled else None
+
+def fetch_all(sql, params = ()):
+    """Run a read query and return its rows, from the result cache while nothing has changed.
+
+    Queued saves are committed first. The rows are a new list on every call, so the
+    caller may change it.
+    """
+    flush_writes()
+    cache = _result_cache
+    key = (sql, tuple(sorted(params.items())) if isinstance(params, dict) else tuple(params))
+    if cache is not None:
+        rows, version = cache.get(key)
+        if rows is not None:
+            return list(rows)
+    with get_connection() as conn:
+        rows = conn.execute(sql, params).fetchall()
+    if cache is not None:
+        cache.put(key, version, rows)
+        return list(rows)
+    return rows
+
+if RESULT_CACHE:
+    set_result_cache(True)
+
+# Secondary indexes managed by init_db(). Names starting with "idx_" that are not
+# listed here are treated as stale and dropped.
+INDEXES = {
+    "idx_translated_title_id": "translated(title_id)",             # Translator join in search_books
+    "idx_books_time_title": "books(time, title)",                  # ORDER BY time, title
+    "idx_books_time_desc_title": "books(time DESC, title ASC)",    # VIEW ALL, newest first
+    "idx_shows_time_title": "shows(time, title)",
+    # Exact-match search filters, with the sort columns so results come out in order
+    "idx_books_language": "books(language, time, title)",
+    "idx_books_original_language": "books(original_language, time, title)",
+    "idx_books_genre": "books(genre, time, title)",
+    "idx_books_rating": "books(rating, time, title)",
+    "idx_shows_type": "shows(type, time, title)",
+    "idx_books_author": "books(author, time)",                     # Top authors in get_report_counts
+    # Year and month search fields and since/until ranges, in search_key order
+    "idx_books_year_month": "books(year, month, title)",
+    "idx_shows_year_month": "shows(year, month, title)",
+    # Seasons of one series in order, and the per-series summary without touching the table
+    "idx_shows_series": "shows(series, season, time)",
+}
+
+# Rows per page for KeysetPager
+PAGE_SIZE = 200
+
+# Fixed read queries shipped by this module. Searches are assembled by QueryBuilder.
+# check_query_plans() explains each of them.
+ALL_BOOKS_SQL = '''
+    SELECT id, title, author, time, language, original_language, genre, rating, note
+    FROM books
+    ORDER BY time, title
+'''
+VIEW_BOOKS_SQL = '''
+    SELECT title, author, time, language, genre, rating
+    FROM books
+    ORDER BY time DESC, title ASC
+'''
+VIEW_SHOWS_SQL = '''
+    SELECT title, time, type 
+    FROM shows 
+    ORDER BY time, title
+'''
+# Backups written by export_as_csv; translators are joined the way the form takes them
+EXPORT_BATCH = 1000
+EXPORT_BOOKS_SQL = '''
+    SELECT b.id, b.title, b.author, b.time, b.language, b.original_language, b.genre, b.rating, b.note,
+           (SELECT group_concat(t.translator, ' / ') FROM translated t WHERE t.title_id = b.id) AS translators
+    FROM books b
+    ORDER BY b.id
+'''
+EXPORT_SHOWS_SQL = "SELECT id, title, time, type, note FROM shows ORDER BY id"
+# Every entry of one series, in season order; entries without a season come first
+SERIES_SEASONS_SQL = '''
+    SELECT season, title, time, type, note
+    FROM shows
+    WHERE series = ?
+    ORDER BY season, time
+'''
+# Report aggregates, computed in SQLite so only the counts leave the database. The
+# counts come straight from the book_counts rollup, already one row per group.
+REPORT_COUNTS_SQL = '''
+    SELECT CAST(substr(time, 1, 4) AS INTEGER) AS year,
+           CAST(substr(time, 6, 2) AS INTEGER) AS month,
+           language, genre, rating, entries
+    FROM book_counts
+    WHERE time >= ?
+'''
+REPORT_AUTHORS_SQL = '''
+    SELECT author, COUNT(*) AS books
+    FROM books
+    WHERE time >= ?
+    GROUP BY author
+    ORDER BY books DESC, author
+    LIMIT ?
+'''
+# bm25 column weights: a hit in the title counts most, a hit in the note least
+BOOKS_FTS_RANK = "bm25(10.0, 5.0, 1.0, 3.0)"   # title, author, note, translator
+SHOWS_FTS_RANK = "bm25(10.0, 1.0)"             # title, note
+# The full-text columns as base table SQL, for words too short for the trigram index
+# (a filled-in Translator field always joins translated t)
+BOOKS_FTS_COLUMNS = {"title": "b.title", "author": "b.author", "note": "b.note", "translator": "t.translator"}
+SHOWS_FTS_COLUMNS = {"title": "s.title", "note": "s.note"}
+
+# Keep books_fts/shows_fts in step with the tables they mirror. rowid is the id of the row.
+FTS_TRIGGERS = [
+    '''CREATE TRIGGER IF NOT EXISTS books_fts_insert AFTER INSERT ON books BEGIN
+        INSERT INTO books_fts (rowid, title, author, note, translator)
+        VALUES (new.id, new.title, new.author, coalesce(new.note, ''), '');
+    END''',
+    '''CREATE TRIGGER IF NOT EXISTS books_fts_delete AFTER DELETE ON books BEGIN
+        DELETE FROM books_fts WHERE rowid = old.id;
+    END''',
+    '''CREATE TRIGGER IF NOT EXISTS books_fts_update AFTER UPDATE OF title, author, note ON books BEGIN
+        UPDATE books_fts SET title = new.title, author = new.author, note = coalesce(new.note, '')
+        WHERE rowid = new.id;
+    END''',
+    '''CREATE TRIGGER IF NOT EXISTS translated_fts_insert AFTER INSERT ON translated BEGIN
+        UPDATE books_fts
+        SET translator = (SELECT group_concat(translator, ' / ') FROM translated WHERE title_id = new.title_id)
+        WHERE rowid = new.title_id;
+    END''',
+    '''CREATE TRIGGER IF NOT EXISTS translated_fts_delete AFTER DELETE ON translated BEGIN
+        UPDATE books_fts
+        SET translator = coalesce((SELECT group_concat(translator, ' / ') FROM translated WHERE title_id = old.title_id), '')
+        WHERE rowid = old.title_id;
+    END''',
+    '''CREATE TRIGGER IF NOT EXISTS shows_fts_insert AFTER INSERT ON shows BEGIN
+        INSERT INTO shows_fts (rowid, title, note) VALUES (new.id, new.title, coalesce(new.note, ''));
+    END''',
+    '''CREATE TRIGGER IF NOT EXISTS shows_fts_delete AFTER DELETE ON shows BEGIN
+        DELETE FROM shows_fts WHERE rowid = old.id;
+    END''',
+    '''CREATE TRIGGER IF NOT EXISTS shows_fts_update AFTER UPDATE OF title, note ON shows BEGIN
+        UPDATE shows_fts SET title = new.title, note = coalesce(new.note, '') WHERE rowid = new.id;
+    END''',
+]
+
+# Rollup tables: entries per month and category of each table, kept up to date by
+# triggers so the stats panels and the report read a few hundred rows, not every row
+ROLLUPS = {
+    "books": ("book_counts", ["language", "genre", "rating"]),
+    "shows": ("show_counts", ["type"]),
+}
+# Totals and the per-category counts of one year, for the stats panels
+STATS_TOTALS_SQL = '''
+    SELECT coalesce(SUM(entries), 0),
+           coalesce(SUM(entries) FILTER (WHERE time >= :year AND time < :next_year), 0),
+           coalesce(SUM(entries) FILTER (WHERE time = :month), 0)
+    FROM {rollup}
+'''
+STATS_BY_SQL = '''
+    SELECT {column}, SUM(entries) AS entries
+    FROM {rollup}
+    WHERE time >= :year AND time < :next_year
+    GROUP BY {column}
+    ORDER BY entries DESC, {column}
+'''
+
+def rollup_triggers(table):
+    """The triggers that count table's rows into its rollup table."""
+    rollup, columns = ROLLUPS[table]
+    keys = ["time"] + columns
+    def add(row):
+        return f'''INSERT INTO {rollup} ({", ".join(keys)}, entries)
+            VALUES ({", ".join(f"{row}.{key}" for key in keys)}, 1)
+            ON CONFLICT DO UPDATE SET entries = entries + 1;'''
+    def remove(row):
+        match = " AND ".join(f"{key} = {row}.{key}" for key in keys)
+        return f'''UPDATE {rollup} SET entries = entries - 1 WHERE {match};
+            DELETE FROM {rollup} WHERE {match} AND entries <= 0;'''
+    return [
+        f"CREATE TRIGGER IF NOT EXISTS {table}_rollup_insert AFTER INSERT ON {table} BEGIN {add('new')} END",
+        f"CREATE TRIGGER IF NOT EXISTS {table}_rollup_delete AFTER DELETE ON {table} BEGIN {remove('old')} END",
+        f"""CREATE TRIGGER IF NOT EXISTS {table}_rollup_update AFTER UPDATE OF {", ".join(keys)} ON {table}
+            BEGIN {remove('old')} {add('new')} END""",
+    ]
+
+def add_year_month(cursor):
+    """Integer year and month columns computed from time, 0 being an unknown month."""
+    for table in ("books", "shows"):
+        cursor.execute(f"""
+            ALTER TABLE {table} ADD COLUMN year INTEGER
+            GENERATED ALWAYS AS (CAST(substr(time, 1, 4) AS INTEGER)) VIRTUAL
+        """)
+        cursor.execute(f"""
+            ALTER TABLE {table} ADD COLUMN month INTEGER
+            GENERATED ALWAYS AS (CAST(substr(time, 6, 2) AS INTEGER)) VIRTUAL
+        """)
+
+def add_series_season(cursor):
+    """Series and season columns for shows, parsed from the "X - Season N" titles saved so far."""
+    cursor.execute("ALTER TABLE shows ADD COLUMN series TEXT")
+    cursor.execute("ALTER TABLE shows ADD COLUMN season INTEGER")
+    rows = cursor.execute("SELECT id, title FROM shows").fetchall()
+    cursor.executemany(
+        "UPDATE shows SET series = ?, season = ? WHERE id = ?",
+        [(*split_season(title), show_id) for show_id, title in rows]
+    )
+
+def retokenize_fts(cursor):
+    """Drop the full-text tables built with the word tokenizer; create_fts refills them with trigrams."""
+    cursor.execute("DROP TABLE IF EXISTS books_fts")
+    cursor.execute("DROP TABLE IF EXISTS shows_fts")
+
+# Schema changes since the first release, in order. PRAGMA user_version holds how
+# many a database has had; append new ones at the end and never reorder them.
+MIGRATIONS = [
+    add_year_month,
+    add_series_season,
+    retokenize_fts,
+]
+
+def migrate(cursor):
+    """Run the MIGRATIONS the database has not had yet, each one all or nothing."""
+    version = cursor.execute("PRAGMA user_version").fetchone()[0]
+    for number, migration in enumerate(MIGRATIONS[version:], start=version + 1):
+        cursor.execute("SAVEPOINT migrate")
+        try:
+            migration(cursor)
+            cursor.execute(f"PRAGMA user_version = {number}")
+        except Exception:
+            cursor.execute("ROLLBACK TO migrate")
+            raise
+        finally:
+            cursor.execute("RELEASE migrate")
+
+@instrument.traced("database.init_db")
 def init_db():
-    with sqlite3.connect(DB_PATH) as conn:
-        conn.execute("PRAGMA foreign_keys = ON")
+    with get_connection() as conn:
         cursor = conn.cursor()
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS books (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                title TEXT NOT NULL,
-                author TEXT NOT NULL,
-                time TEXT NOT NULL,
-                language TEXT NOT NULL,
-                original_language TEXT NOT NULL,
-                genre TEXT NOT NULL,
-                rating TEXT NOT NULL,
-                note TEXT
-            )
-        ''')
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS translated (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                title_id INT,
-                translator TEXT NOT NULL,
-                FOREIGN KEY (title_id) REFERENCES books(id) ON DELETE CASCADE
-            )
-        ''')
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS shows (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                title TEXT NOT NULL,
-                time TEXT NOT NULL,
-                type TEXT NOT NULL,
-                note TEXT
-            )
-        ''')
+        create_tables(cursor)
+        migrate(cursor)
+        create_indexes(cursor)
+        create_fts(cursor)
+        create_rollups(cursor)
 
+def create_tables(cursor):
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS books (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            title TEXT NOT NULL,
+            author TEXT NOT NULL,
+            time TEXT NOT NULL,
+            language TEXT NOT NULL,
+            original_language TEXT NOT NULL,
+            genre TEXT NOT NULL,
+            rating TEXT NOT NULL,
+            note TEXT
+        )
+    ''')
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS translated (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            title_id INT,
+            translator TEXT NOT NULL,
+            FOREIGN KEY (title_id) REFERENCES books(id) ON DELETE CASCADE
+        )
+    ''')
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS shows (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            title TEXT NOT NULL,
+            time TEXT NOT NULL,
+            type TEXT NOT NULL,
+            note TEXT
+        )
+    ''')
 
+def create_indexes(cursor):
+    """Create every index in INDEXES and drop managed indexes that are no longer listed."""
+    cursor.execute("SELECT name FROM sqlite_master WHERE type = 'index' AND name LIKE 'idx\\_%' ESCAPE '\\'")
+    for (name,) in cursor.fetchall():
+        if name not in INDEXES:
+            cursor.execute(f"DROP INDEX IF EXISTS {name}")
+    for name, target in INDEXES.items():
+        cursor.execute(f"CREATE INDEX IF NOT EXISTS {name} ON {target}")
 
-def save_book(book_data):
-    """Expects a tuple of 10 strings: (title, author, year, month, lang, orig_lang, trans, genre, note, rating)"""
-    title, author, year, month, lang, orig_lang, trans, genre, note, rating = book_data
+def create_fts(cursor):
+    """Create the full-text tables and their triggers, filling them from existing rows the first time."""
+    cursor.execute("SELECT name FROM sqlite_master WHERE name IN ('books_fts', 'shows_fts')")
+    existing = {name for (name,) in cursor.fetchall()}
+
+    # Trigrams rather than words: Chinese and Japanese titles have no spaces between
+    # words, and a word tokenizer would index a whole run of them as one token
+    cursor.execute("""
+        CREATE VIRTUAL TABLE IF NOT EXISTS books_fts
+        USING fts5(title, author, note, translator, tokenize='trigram')
+    """)
+    cursor.execute("""
+        CREATE VIRTUAL TABLE IF NOT EXISTS shows_fts
+        USING fts5(title, note, tokenize='trigram')
+    """)
+    cursor.execute("INSERT INTO books_fts (books_fts, rank) VALUES ('rank', ?)", (BOOKS_FTS_RANK,))
+    cursor.execute("INSERT INTO shows_fts (shows_fts, rank) VALUES ('rank', ?)", (SHOWS_FTS_RANK,))
+    create_fts_triggers(cursor)
+
+    if "books_fts" not in existing or "shows_fts" not in existing:
+        rebuild_fts(cursor)
+
+def drop_indexes(cursor, tables = None):
+    """Drop the managed indexes (only those on tables, if given); create_indexes puts them back."""
+    for name, target in INDEXES.items():
+        if tables is None or target.split("(")[0] in tables:
+            cursor.execute(f"DROP INDEX IF EXISTS {name}")
+
+def drop_fts_triggers(cursor):
+    """Stop keeping the full-text tables in sync; create_fts_triggers and rebuild_fts catch them up."""
+    cursor.execute("SELECT name FROM sqlite_master WHERE type = 'trigger' AND name LIKE '%\\_fts\\_%' ESCAPE '\\'")
+    for (name,) in cursor.fetchall():
+        cursor.execute(f"DROP TRIGGER IF EXISTS {name}")
+
+def create_fts_triggers(cursor):
+    for trigger in FTS_TRIGGERS:
+        cursor.execute(trigger)
+
+def rebuild_fts(cursor, tables = ("books", "shows")):
+    """Refill the full-text tables of tables ("books" and/or "shows") from scratch."""
+    if "books" in tables:
+        cursor.execute("DELETE FROM books_fts")
+        cursor.execute("""
+            INSERT INTO books_fts (rowid, title, author, note, translator)
+            SELECT b.id, b.title, b.author, coalesce(b.note, ''),
+                   coalesce((SELECT group_concat(t.translator, ' / ') FROM translated t WHERE t.title_id = b.id), '')
+            FROM books b
+        """)
+    if "shows" in tables:
+        cursor.execute("DELETE FROM shows_fts")
+        cursor.execute("""
+            INSERT INTO shows_fts (rowid, title, note)
+            SELECT id, title, coalesce(note, '') FROM shows
+        """)
+
+def create_rollups(cursor):
+    """Create the rollup tables and their triggers, filling them from existing rows the first time."""
+    cursor.execute("SELECT name FROM sqlite_master WHERE type = 'table'")
+    existing = {name for (name,) in cursor.fetchall()}
+    for table, (rollup, columns) in ROLLUPS.items():
+        keys = ", ".join(["time"] + columns)
+        cursor.execute(f"""
+            CREATE TABLE IF NOT EXISTS {rollup} (
+                {" ".join(f"{key} TEXT NOT NULL," for key in ["time"] + columns)}
+                entries INTEGER NOT NULL,
+                PRIMARY KEY ({keys})
+            ) WITHOUT ROWID
+        """)
+    create_rollup_triggers(cursor)
+    rebuild_rollups(cursor, [table for table, (rollup, _) in ROLLUPS.items() if rollup not in existing])
+
+def drop_rollup_triggers(cursor):
+    """Stop counting rows into the rollups; create_rollup_triggers and rebuild_rollups catch them up."""
+    for table in ROLLUPS:
+        for action in ("insert", "delete", "update"):
+            cursor.execute(f"DROP TRIGGER IF EXISTS {table}_rollup_{action}")
+
+def create_rollup_triggers(cursor):
+    for table in ROLLUPS:
+        for trigger in rollup_triggers(table):
+            cursor.execute(trigger)
+
+def rebuild_rollups(cursor, tables = ("books", "shows")):
+    """Recount the rollups of tables ("books" and/or "shows") from scratch."""
+    for table in tables:
+        if table not in ROLLUPS:
+            continue
+        rollup, columns = ROLLUPS[table]
+        keys = ", ".join(["time"] + columns)
+        cursor.execute(f"DELETE FROM {rollup}")
+        cursor.execute(f"INSERT INTO {rollup} ({keys}, entries) SELECT {keys}, COUNT(*) FROM {table} GROUP BY {keys}")
+
+def month_bound(value, default_month):
+    """(year, month) for "YYYY-MM", or for "YYYY" with default_month. Raises ValueError otherwise."""
+    year, _, month = value.strip().partition("-")
+    if not validation.check_year(year) or not (month == "" or month.isdigit() and int(month) <= 12):
+        raise ValueError(f"Not a YYYY or YYYY-MM month: {value!r}")
+    return int(year), int(month) if month else default_month
+
+class QueryBuilder:
+    """Assemble a SELECT whose WHERE clause only holds the filters that were filled in.
+
+    Filter methods ignore empty values, so an empty form field costs nothing at query time.
+    """
+    def __init__(self, columns, table):
+        self.columns = columns
+        self.table = table
+        self.joins, self.conditions, self.params = [], [], []
+        self.group = ""
+        self.order = ""
+        self.limit_clause = ""
+
+    def copy(self):
+        query = QueryBuilder(self.columns, self.table)
+        query.joins, query.conditions, query.params = self.joins[:], self.conditions[:], self.params[:]
+        query.group, query.order, query.limit_clause = self.group, self.order, self.limit_clause
+        return query
+
+    def join(self, clause):
+        self.joins.append(clause)
+        return self
+
+    def where(self, condition, *params):
+        self.conditions.append(condition)
+        self.params.extend(params)
+        return self
+
+    def equals(self, column, value):
+        """Exact match, for fields picked from a fixed list (combobox fields) and the year and month columns."""
+        if value and not validation.is_empty(value):
+            self.where(f"{column} = ?", value.strip())
+        return self
+
+    def contains(self, column, value):
+        """Substring match. Cannot use an index, so keep it for fields without a better option."""
+        if value and not validation.is_empty(value):
+            self.where(f"{column} LIKE ?", f"%{value.strip()}%")
+        return self
+
+    def months_between(self, table, since = None, until = None):
+        """Rows of table from the month since through the month until, both "YYYY" or "YYYY-MM".
+
+        Either end may be left out. A range on (year, month), so it seeks the year and
+        month index; a whole year counts from its unknown month 0 through December.
+        """
+        if since:
+            self.where(f"({table}.year, {table}.month) >= (?, ?)", *month_bound(since, 0))
+        if until:
+            self.where(f"({table}.year, {table}.month) <= (?, ?)", *month_bound(until, 12))
+        return self
+
+    def group_by(self, column):
+        """Group on one column; build_count then counts its distinct values."""
+        self.group = column
+        return self
+
+    def order_by(self, clause):
+        self.order = clause
+        return self
+
+    def limit(self, count, offset=0):
+        self.limit_clause = f"LIMIT {int(count)} OFFSET {int(offset)}" if offset else f"LIMIT {int(count)}"
+        return self
+
+    def build(self):
+        """Return (sql, params)."""
+        sql = f"SELECT {self.columns} FROM {self.table}"
+        for clause in self.joins:
+            sql += f" JOIN {clause}"
+        if self.conditions:
+            sql += " WHERE " + " AND ".join(self.conditions)
+        if self.group:
+            sql += f" GROUP BY {self.group}"
+        if self.order:
+            sql += f" ORDER BY {self.order}"
+        if self.limit_clause:
+            sql += f" {self.limit_clause}"
+        return sql, tuple(self.params)
+
+    def build_count(self):
+        """Return (sql, params) counting the rows the query would return."""
+        # A grouped query returns one row per value of its group column
+        sql = f"SELECT {f'COUNT(DISTINCT {self.group})' if self.group else 'COUNT(*)'} FROM {self.table}"
+        for clause in self.joins:
+            sql += f" JOIN {clause}"
+        if self.conditions:
+            sql += " WHERE " + " AND ".join(self.conditions)
+        return sql, tuple(self.params)
+
+class Page:
+    """One page of rows from a KeysetPager, with the keys needed to move to its neighbours."""
+    def __init__(self, rows, first_key, last_key, has_previous, has_next):
+        self.rows = rows
+        self.first_key, self.last_key = first_key, last_key
+        self.has_previous, self.has_next = has_previous, has_next
+
+    def __len__(self):
+        return len(self.rows)
+
+    def __iter__(self):
+        return iter(self.rows)
+
+class KeysetPager:
+    """Walk a query page by page, ordered on a unique key, without OFFSET or fetchall().
+
+    key is a list of (column, descending) pairs; together the columns must be unique,
+    e.g. [("b.time", False), ("b.title", False), ("b.id", False)]. Each page seeks straight
+    to the row after (or before) the previous one, so every page costs the same however
+    deep into the library it is.
+    """
+    def __init__(self, query, key, page_size=PAGE_SIZE):
+        self.query = query.copy().order_by("")
+        self.key = key
+        self.page_size = page_size
+
+    def first(self):
+        return self._fetch()
+
+    def last(self):
+        return self._fetch(backward=True)
+
+    def next(self, page):
+        """The page after page, or None at the end."""
+        if not page.rows:
+            return None
+        result = self._fetch(after=page.last_key)
+        return result if result.rows else None
+
+    def previous(self, page):
+        """The page before page, or None at the start."""
+        if not page.rows:
+            return None
+        result = self._fetch(before=page.first_key, backward=True)
+        return result if result.rows else None
+
+    def seek(self, offset):
+        """The page starting at row offset. Uses OFFSET once; keep paging with next()/previous()."""
+        return self._fetch(offset=offset)
+
+    @instrument.traced("database.KeysetPager.count")
+    def count(self):
+        return fetch_all(*self.query.build_count())[0][0]
 
-    # Convert year and month to YYYY-MM format
+    def __iter__(self):
+        """Yield every row in order, holding at most one page in memory."""
+        page = self.first()
+        while page is not None:
+            yield from page.rows
+            page = self.next(page) if page.has_next else None
+
+    def page_query(self, after=None, before=None, backward=False, offset=0):
+        """Return (sql, params) for one page. Fetches one extra row to tell whether more pages follow."""
+        query = self.query.copy()
+        query.columns = ", ".join(column for column, _ in self.key) + ", " + query.columns
+        if after is not None:
+            condition, params = self._keyset_condition(after, forward=True)
+            query.where(condition, *params)
+        if before is not None:
+            condition, params = self._keyset_condition(before, forward=False)
+            query.where(condition, *params)
+        query.order_by(", ".join(
+            f"{column} {'DESC' if descending != backward else 'ASC'}" for column, descending in self.key
+        ))
+        return query.limit(self.page_size + 1, offset).build()
+
+    def _keyset_condition(self, key_values, forward):
+        """WHERE condition selecting rows after (forward) or before key_values in key order."""
+        columns = [column for column, _ in self.key]
+        ops = ["<" if descending == forward else ">" for _, descending in self.key]
+        if len(set(ops)) == 1:
+            # Uniform direction: a row-value comparison the planner turns into an index seek
+            return f"({', '.join(columns)}) {ops[0]} ({', '.join('?' * len(columns))})", tuple(key_values)
+
+        # Mixed directions: expand the comparison, led by a bound on the first column so it still seeks
+        branches, params = [], []
+        for i, column in enumerate(columns):
+            equal = [f"{prev} = ?" for prev in columns[:i]]
+            branches.append("(" + " AND ".join(equal + [f"{column} {ops[i]} ?"]) + ")")
+            params.extend(key_values[:i + 1])
+        condition = f"{columns[0]} {ops[0]}= ? AND ({' OR '.join(branches)})"
+        return condition, (key_values[0],) + tuple(params)
+
+    @instrument.traced("database.KeysetPager.fetch", measure=lambda page: (len(page.rows), None))
+    def _fetch(self, after=None, before=None, backward=False, offset=0):
+        rows = fetch_all(*self.page_query(after, before, backward, offset))
+
+        more = len(rows) > self.page_size
+        rows = rows[:self.page_size]
+        if backward:
+            rows.reverse()
+        width = len(self.key)
+        keys = [row[:width] for row in rows]
+        rows = [row[width:] for row in rows]
+        if backward:
+            has_previous, has_next = more, before is not None
+        else:
+            has_previous, has_next = after is not None or offset > 0, more
+        return Page(rows, keys[0] if keys else None, keys[-1] if keys else None, has_previous, has_next)
+
+# Shortest word the trigram index can look up
+TRIGRAM = 3
+
+def fts_match(fields):
+    """Build an FTS5 MATCH expression from (column, text) pairs.
+
+    Every word of every non-empty text must appear somewhere in its column, so "har pot"
+    finds "Harry Potter" and "森林" finds "挪威的森林". Returns (expression, short):
+    words shorter than TRIGRAM cannot go in the expression and come back as (column,
+    word) pairs to filter with LIKE instead. The expression is "" when there are none.
+    """
+    terms, short = [], []
+    for column, text in fields:
+        for word in text.split():
+            if len(word) < TRIGRAM:
+                short.append((column, word))
+            else:
+                word = word.replace('"', '""')
+                terms.append(f'{column} : "{word}"')
+    return " AND ".join(terms), short
+
+def full_text(query, fts_table, rowid, columns, fields):
+    """Filter query to rows whose columns hold every word of fields, see fts_match.
+
+    rowid is the column of query the fts_table rows are keyed on, and columns maps each
+    full-text column to its SQL on the base table. Short words are matched there with
+    LIKE, as search worked before the full-text index. Results are ranked by relevance
+    when the index could be used; returns whether they are.
+    """
+    match, short = fts_match(fields)
+    if match:
+        query.join(f"{fts_table} f ON f.rowid = {rowid}").where(f"f.{fts_table} MATCH ?", match).order_by("f.rank")
+    for column, word in short:
+        escaped = word.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+        query.where(f"{columns[column]} LIKE ? ESCAPE '\\'", f"%{escaped}%")
+    return bool(match)
+
+def date_string(year, month):
+    """Convert the year and month fields to YYYY-MM; a missing month is 00, a missing year means now."""
     if year and month:
-        date_str = f"{year}-{month.zfill(2)}"  # zfill(2) pads single digits with 0
+        return f"{year}-{month.zfill(2)}"  # zfill(2) pads single digits with 0
     elif year:
-        date_str = f"{year}-00"
+        return f"{year}-00"
     else:
         year = str(datetime.now().year)
         month = str(datetime.now().month)
-        date_str = f"{year}-{month.zfill(2)}"
+        return f"{year}-{month.zfill(2)}"
 
-    # Handle multiple translator of a book
+def split_translators(trans):
+    """Handle multiple translators of a book, entered as "A / B"."""
     trans_split = trans.split('/') if trans else []
-    trans_split = [s.strip() for s in trans_split]
+    return [s.strip() for s in trans_split]
 
-    with sqlite3.connect(DB_PATH) as conn:
-        conn.execute("PRAGMA foreign_keys = ON")
-        cursor = conn.cursor()
+# How save_show writes a season into the title
+SEASON_TITLE = re.compile(r"^(.+) - Season (\d+)$", re.IGNORECASE)
+
+def split_season(title):
+    """Split an "X - Season N" title into (series, season); other titles are a series of their own, season None."""
+    found = SEASON_TITLE.match(title)
+    if found is None:
+        return title, None
+    return found.group(1).strip(), int(found.group(2))
+
+def save(write):
+    """Run write(cursor) in a transaction of its own, or queue it when group commit is on."""
+    queue = _write_queue
+    if queue is not None:
+        queue.put(write)
+        return
+    with get_connection() as conn:
+        write(conn.cursor())
+
+@instrument.traced("database.save_book")
+def save_book(book_data):
+    """Expects a tuple of 10 strings: (title, author, year, month, lang, orig_lang, trans, genre, note, rating)"""
+    title, author, year, month, lang, orig_lang, trans, genre, note, rating = book_data
+
+    date_str = date_string(year, month)
+    trans_split = split_translators(trans)
+
+    def write(cursor):
         cursor.execute('''
             INSERT INTO books (title, author, time, language, original_language, genre, rating, note)
             VALUES (?, ?, ?, ?, ?, ?, ?, ?)
@@ -82,130 +983,164 @@ def save_book(book_data):
 
         # Insert translators if any
         book_id = cursor.lastrowid
-        if trans:
-            for tran in trans_split:
-                cursor.execute('''
-                    INSERT INTO translated (title_id, translator)
-                    VALUES (?, ?)
-                ''', (book_id, tran))
+        for tran in trans_split:
+            cursor.execute('''
+                INSERT INTO translated (title_id, translator)
+                VALUES (?, ?)
+            ''', (book_id, tran))
 
+    save(write)
+
+@instrument.traced("database.save_show")
 def save_show(show_data):
     """Expects a tuple of 6 strings: (title, season, year, month, type, note)"""
     title, season, year, month, type, note = show_data
 
-    # Convert year and month to YYYY-MM format
-    if year and month:
-        date_str = f"{year}-{month.zfill(2)}"  # zfill(2) pads single digits with 0
-    elif year:
-        date_str = f"{year}-00"
-    else:
-        year = str(datetime.now().year)
-        month = str(datetime.now().month)
-        date_str = f"{year}-{month.zfill(2)}"
+    date_str = date_string(year, month)
 
-    # Handle season if provided
+    # Handle season if provided; the title keeps it for display, series and season for lookups
     if not validation.is_empty(season):
         title = f"{title} - Season {season.strip()}"
+    series, season = split_season(title)
 
-    with sqlite3.connect(DB_PATH) as conn:
-        cursor = conn.cursor()
+    def write(cursor):
         cursor.execute('''
-            INSERT INTO shows (title, time, type, note)
-            VALUES (?, ?, ?, ?)
-        ''', (title, date_str, type, note))
-                
-def search_books(book_data):
-    """Expects a tuple of 10 strings: (title, author, year, month, lang, orig_lang, trans, genre, note, rating)"""
-    with sqlite3.connect(DB_PATH) as conn:
-        cursor = conn.cursor()
-        # Translator input is not suppported
-        title, author, year, month, lang, orig_lang, trans, genre, note, rating = book_data
-
-        # Convert year and month to wild card search friendly format
-        if year and month:
-            date_str = f"{year}-{month.zfill(2)}"  # zfill(2) pads single digits with 0
-        elif year and not month:
-            date_str = str(year)
-        elif not year and month:
-            date_str = str(month)
-        else:
-            date_str = ""
+            INSERT INTO shows (title, series, season, time, type, note)
+            VALUES (?, ?, ?, ?, ?, ?)
+        ''', (title, series, season, date_str, type, note))
 
-        if validation.is_empty(trans):
-            cursor.execute('''
-                SELECT title, author, time, language, genre, rating FROM books
-                WHERE title LIKE ?
-                AND author LIKE ?
-                AND time LIKE ?
-                AND language LIKE ?
-                AND original_language LIKE ?
-                AND genre LIKE ?           
-                AND note LIKE ?
-                AND rating LIKE ?
-                ORDER BY time ASC, title ASC
-            ''', (f"%{title}%", f"%{author}%", f"%{date_str}%", f"%{lang}%", f"%{orig_lang}%", f"%{genre}%", f"%{note}%", f"%{rating}%"))
-        else:
-            cursor.execute('''
-                SELECT b.title, b.author, t.translator, b.time, b.language, b.genre, b.rating
-                FROM books b
-                JOIN translated t ON b.id = t.title_id
-                WHERE b.title LIKE ?
-                AND b.author LIKE ?
-                AND b.time LIKE ?
-                AND b.language LIKE ?
-                AND b.original_language LIKE ?
-                AND t.translator LIKE ?
-                AND b.genre LIKE ?           
-                AND b.note LIKE ?
-                AND b.rating LIKE ?
-                ORDER BY b.time ASC, b.title ASC
-            ''',  (f"%{title}%", f"%{author}%", f"%{date_str}%", f"%{lang}%", f"%{orig_lang}%", f"%{trans}%", f"%{genre}%", f"%{note}%", f"%{rating}%"))
-
-        books = cursor.fetchall() 
-    return books
-
-def search_shows(show_data):
-    """Expects a tuple of 6 strings: (title, season, year, month, type, note)"""
-    with sqlite3.connect(DB_PATH) as conn:
-        cursor = conn.cursor()
-        title, season, year, month, type, note = show_data
-
-        # Convert year and month to wild card search friendly format
-        if year and month:
-            date_str = f"{year}-{month.zfill(2)}"  # zfill(2) pads single digits with 0
-        elif year and not month:
-            date_str = str(year)
-        elif not year and month:
-            date_str = str(month)
-        else:
-            date_str = ""
- 
-        if not validation.is_empty(season):
-            title = f"{title} - Season {season.strip()}"
-            cursor.execute('''
-                SELECT title, time, type FROM shows
-                WHERE title LIKE ?
-                AND time LIKE ?
-                AND type LIKE ?           
-                AND note LIKE ?
-                ORDER BY time ASC, title ASC
-            ''', (f"%{title}%", f"%{date_str}%", f"%{type}%", f"%{note}%"))
-        else:
-            cursor.execute('''
-                SELECT title, time, type FROM shows
-                WHERE title LIKE ?
-                AND time LIKE ?
-                AND type LIKE ?           
-                AND note LIKE ?
-                ORDER BY time ASC, title ASC
-            ''', (f"%{title}%", f"%{date_str}%", f"%{type}%", f"%{note}%"))
+    save(write)
+
+def is_dated(year, month, since, until):
+    """Whether a search filters on the date."""
+    return any(value and not validation.is_empty(value) for value in (year, month, since, until))
+
+def search_key(table, dated):
+    """The (column, descending) key search results of table are sorted on.
+
+    Searches with a date filter sort on year and month, the same order as time, so
+    the rows come out of idx_*_year_month already sorted.
+    """
+    columns = ["year", "month", "title", "id"] if dated else ["time", "title", "id"]
+    return [(f"{table}.{column}", False) for column in columns]
+
+def search_order(table, dated):
+    return ", ".join(f"{column} ASC" for column, _ in search_key(table, dated)[:-1])
+
+def book_search_query(book_data, since = None, until = None):
+    """Return the QueryBuilder for search_books. Only the filled-in fields become filters.
+
+    since and until ("YYYY" or "YYYY-MM") limit the books to those read in that range.
+    """
+    title, author, year, month, lang, orig_lang, trans, genre, note, rating = book_data
+    with_translators = not validation.is_empty(trans)
+
+    columns = "b.title, b.author, t.translator, b.time, b.language, b.genre, b.rating" if with_translators \
+        else "b.title, b.author, b.time, b.language, b.genre, b.rating"
+    query = QueryBuilder(columns, "books b")
+    if with_translators:
+        query.join("translated t ON t.title_id = b.id")
+
+    # Free-text fields go through the full-text index and are ranked by relevance
+    fields = [("title", title), ("author", author), ("note", note), ("translator", trans)]
+    if not full_text(query, "books_fts", "b.id", BOOKS_FTS_COLUMNS, fields):
+        query.order_by(search_order("b", is_dated(year, month, since, until)))
 
-        shows = cursor.fetchall() 
-    return shows
+    query.equals("b.year", year)
+    query.equals("b.month", month)
+    query.months_between("b", since, until)
+    query.equals("b.language", lang)
+    query.equals("b.original_language", orig_lang)
+    query.equals("b.genre", genre)
+    query.equals("b.rating", rating)
+    if with_translators:
+        # The book matched on some translator; only list that translator's row
+        query.contains("t.translator", trans)
+    return query
 
+def show_search_query(show_data, since = None, until = None):
+    """Return the QueryBuilder for search_shows; see book_search_query."""
+    title, season, year, month, type, note = show_data
+
+    query = QueryBuilder("s.title, s.time, s.type", "shows s")
+    if not full_text(query, "shows_fts", "s.id", SHOWS_FTS_COLUMNS, [("title", title), ("note", note)]):
+        query.order_by(search_order("s", is_dated(year, month, since, until)))
+
+    query.equals("s.year", year)
+    query.equals("s.month", month)
+    query.months_between("s", since, until)
+    query.equals("s.season", season)
+    query.equals("s.type", type)
+    return query
+
+@instrument.traced("database.search_books")
+def search_books(book_data, since = None, until = None):
+    """Expects a tuple of 10 strings: (title, author, year, month, lang, orig_lang, trans, genre, note, rating)
+
+    since and until ("YYYY" or "YYYY-MM") add a date range, e.g. since="2021-03", until="2022-08".
+    """
+    return fetch_all(*book_search_query(book_data, since, until).build())
+
+@instrument.traced("database.search_shows")
+def search_shows(show_data, since = None, until = None):
+    """Expects a tuple of 6 strings: (title, season, year, month, type, note); since and until as in search_books"""
+    return fetch_all(*show_search_query(show_data, since, until).build())
+
+def books_pager(type = "view", page_size = PAGE_SIZE):
+    """Page through all books. "view" pages the VIEW ALL columns newest first, "all" every column oldest first."""
+    if type == "all":
+        query = QueryBuilder("b.id, b.title, b.author, b.time, b.language, b.original_language, b.genre, b.rating, b.note", "books b")
+        key = [("b.time", False), ("b.title", False), ("b.id", False)]
+    else:
+        query = QueryBuilder("b.title, b.author, b.time, b.language, b.genre, b.rating", "books b")
+        key = [("b.time", True), ("b.title", False), ("b.id", False)]
+    return KeysetPager(query, key, page_size)
+
+def shows_pager(page_size = PAGE_SIZE):
+    """Page through all shows in get_shows() order."""
+    query = QueryBuilder("s.title, s.time, s.type", "shows s")
+    return KeysetPager(query, [("s.time", False), ("s.title", False), ("s.id", False)], page_size)
+
+def search_books_pager(book_data, page_size = PAGE_SIZE, since = None, until = None):
+    """Page through search_books results, ordered by time and title rather than relevance."""
+    query = book_search_query(book_data, since, until)
+    key = search_key("b", is_dated(book_data[2], book_data[3], since, until))
+    if not validation.is_empty(book_data[6]):
+        key.append(("t.id", False))  # One row per translator
+    return KeysetPager(query, key, page_size)
+
+def search_shows_pager(show_data, page_size = PAGE_SIZE, since = None, until = None):
+    """Page through search_shows results, ordered by time and title rather than relevance."""
+    key = search_key("s", is_dated(show_data[2], show_data[3], since, until))
+    return KeysetPager(show_search_query(show_data, since, until), key, page_size)
+
+def series_pager(page_size = PAGE_SIZE):
+    """Page through every series: (series, entries, first watched, last watched), by series name.
+
+    Grouped over idx_shows_series alone, so the table itself is never read. Every
+    show has a series; a row without one could not be paged to by key, so it is left
+    out here and in count() alike.
+    """
+    query = QueryBuilder("s.series, COUNT(*), MIN(s.time), MAX(s.time)", "shows s")
+    query.where("s.series IS NOT NULL").group_by("s.series")
+    return KeysetPager(query, [("s.series", False)], page_size)
+
+@instrument.traced("database.get_series")
+def get_series(series):
+    """All seasons of series, with when the first and the last of them were watched.
+
+    Returns {"series": series, "seasons": [(season, title, time, type, note), ...],
+    "first": time, "last": time}; first and last are None for an unknown series.
+    """
+    seasons = fetch_all(SERIES_SEASONS_SQL, (series,))
+    times = [row[2] for row in seasons]
+    return {"series": series, "seasons": seasons,
+            "first": min(times, default=None), "last": max(times, default=None)}
+
+@instrument.traced("database.delete_last_entry")
 def delete_last_entry(table):
-    with sqlite3.connect(DB_PATH) as conn:
-        conn.execute("PRAGMA foreign_keys = ON")
+    flush_writes()
+    with get_connection() as conn:
         cursor = conn.cursor()
         if table == "books":
             cursor.execute("""
@@ -221,50 +1156,256 @@ def delete_last_entry(table):
             """)
     return
 
-def export_as_csv(output_file = "READ.csv"):
-    output_file = os.path.join(BASE_DIR, output_file)
-    with sqlite3.connect(DB_PATH) as conn:
+def export_files_size(paths):
+    return None, sum(os.path.getsize(path) for path in paths)
+
+@instrument.traced("database.export_as_csv", measure=export_files_size)
+def export_as_csv(output_file = "READ.csv", shows_file = "WATCHED.csv", compress = False, progress = None):
+    """Back up books (with their translators) and shows to two CSV files in BASE_DIR.
+
+    Rows are streamed EXPORT_BATCH at a time, so memory use does not grow with the library.
+    compress writes gzip files (".gz" is appended to the names). progress(done, total) is
+    called after every batch with the number of rows written so far across both files.
+    Returns the paths written.
+    """
+    exports = [(output_file, EXPORT_BOOKS_SQL), (shows_file, EXPORT_SHOWS_SQL)]
+    paths = []
+    flush_writes()
+    with get_connection() as conn:
         cursor = conn.cursor()
-        cursor.execute("SELECT * FROM books")
-        # Get column names
-        column_names = [description[0] for description in cursor.description]
-        
-        # Write to CSV
-        with open(output_file, 'w', newline='', encoding='utf-8-sig') as f:
-            writer = csv.writer(f)
-            writer.writerow(column_names)  # Write headers
-            writer.writerows(cursor.fetchall())  # Write data
-    return
+        total = sum(conn.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0] for table in ("books", "shows"))
+        done = 0
+        for file_name, sql in exports:
+            path = os.path.join(BASE_DIR, file_name + (".gz" if compress else ""))
+            # Write next to the target and swap it in at the end, so a failed export keeps the old backup
+            tmp_path = path + ".tmp"
+            opener = gzip.open if compress else open
+            with opener(tmp_path, 'wt', newline='', encoding='utf-8-sig') as f:
+                writer = csv.writer(f)
+                cursor.execute(sql)
+                writer.writerow([description[0] for description in cursor.description])  # Write headers
+                while True:
+                    rows = cursor.fetchmany(EXPORT_BATCH)
+                    if not rows:
+                        break
+                    writer.writerows(rows)
+                    done += len(rows)
+                    if progress is not None:
+                        progress(done, total)
+            os.replace(tmp_path, path)
+            paths.append(path)
+    return paths
 
+@instrument.traced("database.get_books")
 def get_books(type = "all"):
     """Retrieve all books from the database."""
-    with sqlite3.connect(DB_PATH) as conn:
-        cursor = conn.cursor()
-        
-        if type == "all":
-            cursor.execute("""
-                SELECT * 
-                FROM books 
-                ORDER BY time, title
-            """)
-        elif type == "view":
-            cursor.execute("""
-                SELECT title, author, time, language, genre, rating
-                FROM books
-                ORDER BY time DESC, title ASC
-            """)
-
-        books = cursor.fetchall() 
-    return books
+    return fetch_all(ALL_BOOKS_SQL if type == "all" else VIEW_BOOKS_SQL)
 
+@instrument.traced("database.get_shows")
 def get_shows():
     """Retrieve all shows from the database."""
-    with sqlite3.connect(DB_PATH) as conn:
-        cursor = conn.cursor()
-        cursor.execute("""
-            SELECT title, time, type 
-            FROM shows 
-            ORDER BY time, title
-        """)
-        shows = cursor.fetchall() 
-    return shows
\ No newline at end of file
+    return fetch_all(VIEW_SHOWS_SQL)
+
+@instrument.traced("database.get_report_counts", measure=lambda counts: (len(counts["counts"]), None))
+def get_report_counts(since = "0000-00", top_authors = 5):
+    """Book counts for the report, grouped in SQLite.
+
+    Returns {"counts": [(year, month, language, genre, rating, count), ...],
+    "authors": [(author, count), ...]} for books read since the YYYY-MM since, with
+    the top_authors most read authors. The result grows with the number of categories,
+    not the number of books.
+    """
+    counts = fetch_all(REPORT_COUNTS_SQL, (since,))
+    authors = fetch_all(REPORT_AUTHORS_SQL, (since, top_authors))
+    return {"counts": counts, "authors": authors}
+
+def stats_params(year = None):
+    now = datetime.now()
+    year = now.year if year is None else int(year)
+    return {"year": f"{year}", "next_year": f"{year + 1}", "month": f"{now.year}-{now.month:02d}"}
+
+@instrument.traced("database.get_stats")
+def get_stats(table, year = None):
+    """Counts for the stats panels, read from the rollup of table ("books" or "shows").
+
+    Returns {"total": all time, "year": in year, "month": this month, "by": {column:
+    [(value, count), ...]}} with the categories counted over year (default this year),
+    most first. The work grows with the number of categories, not of rows.
+    """
+    rollup, columns = ROLLUPS[table]
+    params = stats_params(year)
+    total, in_year, in_month = fetch_all(STATS_TOTALS_SQL.format(rollup=rollup), params)[0]
+    by = {column: fetch_all(STATS_BY_SQL.format(rollup=rollup, column=column), params) for column in columns}
+    return {"total": total, "year": in_year, "month": in_month, "by": by}
+
+def explain_query_plan(cursor, sql, params=()):
+    """Return the detail column of EXPLAIN QUERY PLAN for sql."""
+    cursor.execute(f"EXPLAIN QUERY PLAN {sql}", params)
+    return [row[3] for row in cursor.fetchall()]
+
+def check_query_plans(conn=None):
+    """Explain every shipped read query and report full table scans and temp B-tree sorts.
+
+    Runs against a fresh in-memory schema unless a connection is given.
+    Returns a list of (query name, plan step) problems; an empty list means all queries are clean.
+    """
+    if conn is None:
+        conn = sqlite3.connect(":memory:")
+        create_tables(conn.cursor())
+        migrate(conn.cursor())
+        create_indexes(conn.cursor())
+        create_fts(conn.cursor())
+        create_rollups(conn.cursor())
+
+    empty_book, empty_show = ("",) * 10, ("",) * 6
+    def book(**fields):
+        keys = ["title", "author", "year", "month", "lang", "orig_lang", "trans", "genre", "note", "rating"]
+        return tuple(fields.get(key, "") for key in keys)
+
+    queries = [
+        ("get_books(all)", ALL_BOOKS_SQL, ()),
+        ("get_books(view)", VIEW_BOOKS_SQL, ()),
+        ("get_shows", VIEW_SHOWS_SQL, ()),
+        ("get_report_counts", REPORT_COUNTS_SQL, ("2020-01",)),
+        ("get_report_counts(authors)", REPORT_AUTHORS_SQL, ("2020-01", 5)),
+        ("get_stats(books)", STATS_TOTALS_SQL.format(rollup="book_counts"), stats_params()),
+        ("get_stats(books, genre)", STATS_BY_SQL.format(rollup="book_counts", column="genre"), stats_params()),
+        ("get_stats(shows, type)", STATS_BY_SQL.format(rollup="show_counts", column="type"), stats_params()),
+        ("export_as_csv(books)", EXPORT_BOOKS_SQL, ()),
+        ("export_as_csv(shows)", EXPORT_SHOWS_SQL, ()),
+        ("get_series", SERIES_SEASONS_SQL, ("a",)),
+        ("series_pager.count", *series_pager().query.build_count()),
+        ("series_pager.next", *series_pager().page_query(after=("a",))),
+        ("search_books(empty)", *book_search_query(empty_book).build()),
+        ("search_books(title)", *book_search_query(book(title="harry")).build()),
+        ("search_books(translator)", *book_search_query(book(trans="a", genre="Fiction")).build()),
+        ("search_books(title 森林)", *book_search_query(book(title="森林")).build()),
+        ("search_books(title 挪威的森林)", *book_search_query(book(title="挪威的森林")).build()),
+        ("search_books(translator 明珠)", *book_search_query(book(trans="明珠")).build()),
+        ("search_shows(title 巨人)", *show_search_query(("巨人", "", "", "", "", "")).build()),
+        ("search_books(year)", *book_search_query(book(year="2023")).build()),
+        ("search_books(year, month)", *book_search_query(book(year="2023", month="1")).build()),
+        ("search_books(month)", *book_search_query(book(month="1")).build()),
+        ("search_books(since, until)", *book_search_query(empty_book, "2021-03", "2022-08").build()),
+        ("search_shows(since)", *show_search_query(empty_show, "2021").build()),
+        ("search_books(language)", *book_search_query(book(lang="English")).build()),
+        ("search_books(original_language)", *book_search_query(book(orig_lang="English")).build()),
+        ("search_books(genre, rating)", *book_search_query(book(genre="Fiction", rating="Love")).build()),
+        ("search_shows(empty)", *show_search_query(empty_show).build()),
+        ("search_shows(title, season)", *show_search_query(("harry", "2", "", "", "", "")).build()),
+        ("search_shows(type)", *show_search_query(("", "", "", "", "Drama", "")).build()),
+        ("books_pager(all).next", *books_pager("all").page_query(after=("2023-01", "a", 1))),
+        ("books_pager(view).next", *books_pager("view").page_query(after=("2023-01", "a", 1))),
+        ("books_pager(view).previous", *books_pager("view").page_query(before=("2023-01", "a", 1), backward=True)),
+        ("shows_pager.next", *shows_pager().page_query(after=("2023-01", "a", 1))),
+        ("search_books_pager(genre).next", *search_books_pager(book(genre="Fiction")).page_query(after=("2023-01", "a", 1))),
+        ("search_books_pager(since).next", *search_books_pager(empty_book, since="2021").page_query(after=(2021, 5, "a", 1))),
+        # The pages the GUI fetches for a text search, ordered by key rather than rank
+        ("search_books_pager(title).first", *search_books_pager(book(title="potter")).page_query()),
+        ("search_books_pager(title).next", *search_books_pager(book(title="potter")).page_query(after=("2023-01", "a", 1))),
+        ("search_shows_pager(title).next", *search_shows_pager(("巨人的", "", "", "", "", "")).page_query(after=("2023-01", "a", 1))),
+    ]
+
+    # Steps that are the point of the query rather than a missing index
+    expected = {
+        # Every row, in display order
+        "get_books(all)": {"SCAN books USING INDEX idx_books_time_title"},
+        "get_books(view)": {"SCAN books USING INDEX idx_books_time_desc_title"},
+        "get_shows": {"SCAN shows USING INDEX idx_shows_time_title"},
+        "search_books(empty)": {"SCAN b USING INDEX idx_books_time_title"},
+        "search_shows(empty)": {"SCAN s USING INDEX idx_shows_time_title"},
+        "get_report_counts(authors)": {"USE TEMP B-TREE FOR ORDER BY"},  # Top-N sorts one row per author
+        "export_as_csv(books)": {"SCAN b"},  # Backups read every row, in rowid order
+        "export_as_csv(shows)": {"SCAN shows"},
+        # Words under three characters are too short for the trigram index: LIKE reads
+        # the rows in time order, and a page stops as soon as it is full
+        "search_books(title 森林)": {"SCAN b USING INDEX idx_books_time_title"},
+        "search_books(translator 明珠)": {"SCAN b USING INDEX idx_books_time_title"},
+        "search_shows(title 巨人)": {"SCAN s USING INDEX idx_shows_time_title"},
+        # Full-text matches come out by rowid; the GUI's pages sort them into key order
+        "search_books_pager(title).first": {"USE TEMP B-TREE FOR ORDER BY"},
+        "search_books_pager(title).next": {"USE TEMP B-TREE FOR ORDER BY"},
+        "search_shows_pager(title).next": {"USE TEMP B-TREE FOR ORDER BY"},
+        # A month in every year. Without ANALYZE statistics SQLite reads the whole
+        # year/month index; with them it skip-scans the years and needs no sort
+        "search_books(month)": {"SCAN b USING INDEX idx_books_year_month", "USE TEMP B-TREE FOR RIGHT PART OF ORDER BY"},
+        # Rollups hold one row per month and category, small enough to scan and sort
+        "get_stats(books)": {"SCAN book_counts"},
+        "get_stats(books, genre)": {"USE TEMP B-TREE FOR GROUP BY", "USE TEMP B-TREE FOR ORDER BY"},
+        "get_stats(shows, type)": {"USE TEMP B-TREE FOR GROUP BY", "USE TEMP B-TREE FOR ORDER BY"},
+    }
+
+    problems = []
+    cursor = conn.cursor()
+    for name, sql, params in queries:
+        for step in explain_query_plan(cursor, sql, params):
+            if step in expected.get(name, ()):
+                continue
+            # A scan through a non-covering index still reads every row of the table, just in index order
+            full_scan = step.startswith("SCAN") and "COVERING INDEX" not in step and "VIRTUAL TABLE" not in step
+            if full_scan or "USE TEMP B-TREE" in step:
+                problems.append((name, step))
+    return problems
+
+
+# check_searches() saves these and runs the searches, each of which must find its title
+CHECK_BOOKS = [
+    ("挪威的森林", "村上春樹", "2023", "5", "Chinese", "Japanese", "賴明珠", "Fiction", "", "Love"),
+    ("Harry Potter", "J. K. Rowling", "2022", "1", "English", "English", "", "Fiction", "Reread", "Like"),
+]
+CHECK_SHOWS = [("進擊的巨人", "2", "2021", "3", "Anime", "")]
+SEARCH_CHECKS = [
+    ("books", {"title": "森林"}, "挪威的森林"),            # Two characters, too short for a trigram
+    ("books", {"title": "的森林"}, "挪威的森林"),          # Inside an unspaced run
+    ("books", {"title": "挪威 森林"}, "挪威的森林"),
+    ("books", {"trans": "明珠"}, "挪威的森林"),
+    ("books", {"author": "春樹"}, "挪威的森林"),
+    ("books", {"title": "har pot"}, "Harry Potter"),
+    ("books", {"title": "potter", "note": "reread"}, "Harry Potter"),
+    ("shows", {"title": "巨人", "season": "2"}, "進擊的巨人 - Season 2"),
+]
+
+def check_searches():
+    """Run SEARCH_CHECKS against a fresh in-memory database; returns the ones that found nothing."""
+    book_keys = ["title", "author", "year", "month", "lang", "orig_lang", "trans", "genre", "note", "rating"]
+    show_keys = ["title", "season", "year", "month", "type", "note"]
+
+    conn = sqlite3.connect(":memory:")
+    cursor = conn.cursor()
+    create_tables(cursor)
+    migrate(cursor)
+    create_indexes(cursor)
+    create_fts(cursor)
+    for book in CHECK_BOOKS:
+        cursor.execute("INSERT INTO books (title, author, time, language, original_language, genre, note, rating)"
+                       " VALUES (?, ?, ?, ?, ?, ?, ?, ?)", (*book[:2], date_string(*book[2:4]), *book[4:6], *book[7:]))
+        cursor.execute("INSERT INTO translated (title_id, translator) VALUES (?, ?)", (cursor.lastrowid, book[6]))
+    for title, season, year, month, type, note in CHECK_SHOWS:
+        title = f"{title} - Season {season}"
+        cursor.execute("INSERT INTO shows (title, series, season, time, type, note) VALUES (?, ?, ?, ?, ?, ?)",
+                       (title, *split_season(title), date_string(year, month), type, note))
+
+    failed = []
+    for table, fields, title in SEARCH_CHECKS:
+        if table == "books":
+            query = book_search_query(tuple(fields.get(key, "") for key in book_keys))
+        else:
+            query = show_search_query(tuple(fields.get(key, "") for key in show_keys))
+        if title not in [row[0] for row in cursor.execute(*query.build())]:
+            failed.append((table, fields))
+    conn.close()
+    return failed
+
+def main():
+    problems = check_query_plans()
+    for name, step in problems:
+        print(f"{name}: {step}")
+    failed = check_searches()
+    for table, fields in failed:
+        print(f"search_{table}({fields}) missed its row")
+    if problems or failed:
+        sys.exit(1)
+    print("All query plans use indexes and all searches find their rows.")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,250 @@
+"""Bulk import of books and shows from CSV files.
+
+The files export_as_csv writes (plain or .gz) import as they are. Any other CSV works
+with a column mapping: a dict from the fields below to the CSV headers holding them.
+
+Books:
+    title, author, language, original_language, genre, rating   required
+    time (YYYY-MM or YYYY), or year and month                     optional, as on the form
+    translators ("A / B", split like the form's Translator field)  optional
+    note, id                                                      optional
+Shows:
+    title, type                                                   required
+    time, or year and month                                       optional
+    season (added to the title like the form's Season field)      optional
+    note, id                                                      optional
+
+For example, a spreadsheet with "Book", "Writer", "Finished" and "Lang" columns:
+    import_books_csv("books.csv", {"title": "Book", "author": "Writer", "time": "Finished",
+                                   "language": "Lang", "original_language": "Lang",
+                                   "genre": "Genre", "rating": "Rating"})
+"""
+import csv
+import gzip
+from contextlib import contextmanager
+from database import database
+from utils import instrument, validation
+
+IMPORT_BATCH = 5000  # Rows per executemany call
+VALIDATE_CHUNK = 200_000  # Rows per pandas chunk when validating a file
+# Dropping the indexes and rebuilding them afterwards pays off once a file adds about
+# this share of the rows already in the table; below it, updating them row by row is faster
+DEFER_SHARE = 0.3
+
+BOOK_FIELDS = {"id", "title", "author", "time", "year", "month", "language", "original_language",
+               "genre", "rating", "note", "translators"}
+BOOK_REQUIRED = ["title", "author", "language", "original_language", "genre", "rating"]
+SHOW_FIELDS = {"id", "title", "season", "time", "year", "month", "type", "note"}
+SHOW_REQUIRED = ["title", "type"]
+
+# export_as_csv's headers are the field names themselves
+BOOK_EXPORT_MAPPING = {field: field for field in ["id", "title", "author", "time", "language",
+                                                  "original_language", "genre", "rating", "note", "translators"]}
+SHOW_EXPORT_MAPPING = {field: field for field in ["id", "title", "time", "type", "note"]}
+
+
+def open_csv(path):
+    """Open a CSV file, or a gzip-compressed one ending in .gz, for reading text."""
+    opener = gzip.open if path.endswith(".gz") else open
+    return opener(path, "rt", newline="", encoding="utf-8-sig")
+
+def check_columns(path, headers, mapping, fields, required):
+    """Raise ValueError if mapping names unknown fields or columns the file lacks."""
+    unknown = set(mapping) - fields
+    if unknown:
+        raise ValueError(f"Unknown import fields: {', '.join(sorted(unknown))}")
+    missing = [field for field in required if mapping.get(field) not in headers]
+    missing += [column for column in mapping.values() if column not in headers and column not in missing]
+    if missing:
+        raise ValueError(f"{path} has no column for: {', '.join(missing)}")
+
+def read_records(path, mapping, fields, required):
+    """Yield (line number, {field: stripped text}) for every row of the CSV file at path."""
+    with open_csv(path) as f:
+        reader = csv.DictReader(f)
+        check_columns(path, reader.fieldnames or [], mapping, fields, required)
+        for record in reader:
+            yield reader.line_num, {field: (record[column] or "").strip() for field, column in mapping.items()}
+
+def record_time(line, record):
+    """The YYYY-MM time of a record, from its time field or its year and month fields."""
+    if record.get("time"):
+        year, _, month = record["time"].partition("-")
+    else:
+        year, month = record.get("year", ""), record.get("month", "")
+    month = month.lstrip("0")  # "00" is an unknown month
+    if not validation.check_year(year, accept_empty=True) or not validation.check_month(month, accept_empty=True):
+        raise ValueError(f"Line {line}: invalid date {record.get('time') or (year, month)}")
+    return database.date_string(year, month)
+
+@instrument.traced("importer.validate_csv", measure=lambda errors: (len(errors), None))
+def validate_csv(path, mapping, fields, required, rules, chunksize = VALIDATE_CHUNK):
+    """Check the whole CSV file at path against rules before anything is imported.
+
+    The file is read with pandas in chunks and each column checked at once, see
+    validation.validate_frame. Returns the problems found, with row counting the
+    header as row 1 (the line number, unless a quoted field spans lines).
+    """
+    import pandas as pd
+
+    with open_csv(path) as f:
+        check_columns(path, next(csv.reader(f), []), mapping, fields, required)
+    problems = [validation.validate_frame(pd.DataFrame(), rules)]  # Keeps the columns for a file with no rows
+    with open_csv(path) as f:
+        reader = pd.read_csv(f, dtype=str, keep_default_na=False, usecols=set(mapping.values()), chunksize=chunksize)
+        for chunk in reader:
+            # Per field, since one column may feed several (e.g. language and original_language)
+            chunk = pd.DataFrame({field: chunk[column] for field, column in mapping.items()}, index=chunk.index)
+            chunk.index += 2
+            problems.append(validation.validate_frame(chunk, rules))
+    return pd.concat(problems, ignore_index=True)
+
+def raise_for_problems(problems):
+    if len(problems):
+        raise ValueError(validation.summarize_errors(problems))
+
+def count_rows(path):
+    """Rows of the CSV file at path, counted as lines after the header without parsing them."""
+    opener = gzip.open if path.endswith(".gz") else open
+    with opener(path, "rb") as f:
+        lines = sum(chunk.count(b"\n") for chunk in iter(lambda: f.read(1 << 20), b""))
+    return max(lines - 1, 0)
+
+def worth_deferring(table, incoming):
+    """Whether loading incoming rows into table is faster with defer_indexes, see DEFER_SHARE."""
+    existing = database.fetch_all(f"SELECT COUNT(*) FROM {table}")[0][0]
+    return incoming >= existing * DEFER_SHARE
+
+def check_required(line, record, required):
+    for field in required:
+        if validation.is_empty(record[field]):
+            raise ValueError(f"Line {line}: {field} is empty")
+
+def next_id(cursor, table):
+    """The first id AUTOINCREMENT would hand out next in table."""
+    cursor.execute(f"""
+        SELECT max(coalesce((SELECT max(id) FROM {table}), 0),
+                   coalesce((SELECT seq FROM sqlite_sequence WHERE name = ?), 0)) + 1
+    """, (table,))
+    return cursor.fetchone()[0]
+
+def batches(items, size=IMPORT_BATCH):
+    batch = []
+    for item in items:
+        batch.append(item)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+@contextmanager
+def bulk_load(tables, defer_indexes = True, conn = None):
+    """Yield a cursor inside one transaction for loading many rows into tables.
+
+    Any error rolls the whole load back. With defer_indexes the indexes on tables and
+    the full-text and rollup triggers are dropped first and rebuilt once at the end,
+    instead of being updated for every row. conn defaults to the thread's connection.
+    """
+    database.flush_writes()  # Queued saves go first, so next_id sees them
+    conn = database.get_connection() if conn is None else conn
+    cursor = conn.cursor()
+    with conn:
+        cursor.execute("BEGIN")  # Explicit, so the DDL below is part of the transaction too
+        if defer_indexes:
+            database.drop_fts_triggers(cursor)
+            database.drop_rollup_triggers(cursor)
+            database.drop_indexes(cursor, tables)
+        yield cursor
+        if defer_indexes:
+            database.create_indexes(cursor)
+            database.create_fts_triggers(cursor)
+            database.rebuild_fts(cursor, tables)
+            database.create_rollup_triggers(cursor)
+            database.rebuild_rollups(cursor, tables)
+    conn.execute("PRAGMA main.optimize")
+
+def run_import(tables, insert_batch, rows, defer_indexes, progress):
+    """Insert rows batch by batch with bulk_load and return how many there were."""
+    count = 0
+    with bulk_load(tables, defer_indexes) as cursor:
+        for batch in batches(rows(cursor)):
+            insert_batch(cursor, batch)
+            count += len(batch)
+            if progress is not None:
+                progress(count, None)
+    return count
+
+@instrument.traced("importer.import_books_csv", measure=lambda count: (count, None))
+def import_books_csv(path, mapping = None, keep_ids = True, defer_indexes = None, progress = None, validate = True):
+    """Import books (and their translators) from the CSV file at path. Returns the number imported.
+
+    mapping defaults to export_as_csv's columns. keep_ids keeps the file's ids, for
+    restoring a backup into an empty database; otherwise books are numbered after the
+    existing ones. defer_indexes is passed to bulk_load; None decides by the size of
+    the file next to the table (worth_deferring). progress(done, None) is called after
+    every batch. validate checks the whole file first and raises ValueError listing the
+    bad rows, so a file with mistakes never starts a load.
+    """
+    mapping = BOOK_EXPORT_MAPPING if mapping is None else mapping
+    keep_ids = keep_ids and "id" in mapping
+    if validate:
+        raise_for_problems(validate_csv(path, mapping, BOOK_FIELDS, BOOK_REQUIRED, validation.BOOK_RULES))
+    if defer_indexes is None:
+        defer_indexes = worth_deferring("books", count_rows(path))
+
+    def rows(cursor):
+        book_id = next_id(cursor, "books")
+        for line, record in read_records(path, mapping, BOOK_FIELDS, BOOK_REQUIRED):
+            check_required(line, record, BOOK_REQUIRED)
+            if keep_ids:
+                book_id = int(record["id"])
+            book = (
+                book_id, record["title"], record["author"], record_time(line, record), record["language"],
+                record["original_language"], record["genre"], record["rating"], record.get("note") or None,
+            )
+            yield book, [(book_id, name) for name in database.split_translators(record.get("translators"))]
+            book_id += 1
+
+    def insert_batch(cursor, batch):
+        cursor.executemany('''
+            INSERT INTO books (id, title, author, time, language, original_language, genre, rating, note)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+        ''', [book for book, _ in batch])
+        cursor.executemany('''
+            INSERT INTO translated (title_id, translator)
+            VALUES (?, ?)
+        ''', [translator for _, translators in batch for translator in translators])
+
+    return run_import(("books", "translated"), insert_batch, rows, defer_indexes, progress)
+
+@instrument.traced("importer.import_shows_csv", measure=lambda count: (count, None))
+def import_shows_csv(path, mapping = None, keep_ids = True, defer_indexes = None, progress = None, validate = True):
+    """Import shows from the CSV file at path; see import_books_csv."""
+    mapping = SHOW_EXPORT_MAPPING if mapping is None else mapping
+    keep_ids = keep_ids and "id" in mapping
+    if validate:
+        raise_for_problems(validate_csv(path, mapping, SHOW_FIELDS, SHOW_REQUIRED, validation.SHOW_RULES))
+    if defer_indexes is None:
+        defer_indexes = worth_deferring("shows", count_rows(path))
+
+    def rows(cursor):
+        show_id = next_id(cursor, "shows")
+        for line, record in read_records(path, mapping, SHOW_FIELDS, SHOW_REQUIRED):
+            check_required(line, record, SHOW_REQUIRED)
+            if keep_ids:
+                show_id = int(record["id"])
+            title = record["title"]
+            if not validation.is_empty(record.get("season", "")):
+                title = f"{title} - Season {record['season']}"
+            yield (show_id, title, *database.split_season(title), record_time(line, record), record["type"],
+                   record.get("note") or None)
+            show_id += 1
+
+    def insert_batch(cursor, batch):
+        cursor.executemany('''
+            INSERT INTO shows (id, title, series, season, time, type, note)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+        ''', batch)
+
+    return run_import(("shows",), insert_batch, rows, defer_indexes, progress)
@@ -1,8 +1,10 @@
 import tkinter as tk
-from tkinter import ttk, messagebox
-from database import database
-from reporting import report
-from utils import validation
+from tkinter import ttk, messagebox, filedialog
+from database import database, importer, calibre
+from utils import instrument, validation
+from utils.constants import GENRES, LANGUAGES, RATINGS
+from gui.virtual_tree import VirtualTreeview, open_pager
+from gui.worker import BackgroundWorker, BusyBar
 
 # Home window dimensions
 WINDOW_WIDTH, WINDOW_HEIGHT, PADDING = 1000, 750, 30
@@ -29,26 +31,16 @@ FONTS = {
     "button": ("Segoe UI", 10, "bold"),
 }
 
-GENRES = [
-    'Economics', 'Fiction', 'Finance', 'History', 'Linguistics', 
-    'Marketing', 'Mathematics', 'Memoir', 'News Magazine', 
-    'Philosophy', 'Psychology', 'Science', 'Self-Help', 
-    'Short Story', 'Sociology', 'Soft Skill', 'Travel', 'Urban Design',
-    'Others'
-]
-
-LANGUAGES = [
-    'English', 'Chinese', 'French', 'Japanese','Korean', 'Russian',
-    'German', 'Hebrew', 'Spanish','Dutch', 'Swedish','Others'
-]
+# Stats panel: categories listed per line, and where its text wraps
+STATS_TOP, STATS_WRAP = 3, 380
 
-RATINGS = [
-    ("Love", "#E74C3C"),      # Vibrant red
-    ("Like", "#3498DB"),      # Blue
-    ("Fine", "#95A5A6"),      # Gray
-    ("Meh", "#2C3E50"),       # Dark blue-black
-    ("Textbook", "#C77DFF")     # Purple
-]
+RATING_COLORS = {
+    "Love": "#E74C3C",      # Vibrant red
+    "Like": "#3498DB",      # Blue
+    "Fine": "#95A5A6",      # Gray
+    "Meh": "#2C3E50",       # Dark blue-black
+    "Textbook": "#C77DFF"     # Purple
+}
 
 class BookApp:
     def __init__(self, root):
@@ -80,7 +72,25 @@ class BookApp:
         self._create_form_fields(left_frame)
         self._create_rating_buttons(left_frame)
         self._create_action_buttons(right_frame)
+        self._create_stats_panel(right_frame)
+
+        # Database and report calls run on a worker thread so the window never freezes
+        self.busy_bar = BusyBar(main_frame, on_cancel=self.cancel_jobs)
+        self.worker = BackgroundWorker(self.root, on_busy=self.busy_bar.set_busy)
+        self.refresh_stats()
+
+    def cancel_jobs(self):
+        self.worker.cancel_all()
+
+    def refresh_stats(self):
+        # Read from the rollup tables, so this stays instant however large the library grows
+        self.worker.submit(
+            database.get_stats, "books",
+            on_success=self._show_stats,
+            on_error=lambda e: self.stats_var.set(f"Could not load stats: {e}")
+        )
 
+    @instrument.traced("gui.BookApp.submit_book")
     def submit_book(self):
         # Data collection with 10 items
         data = tuple(
@@ -105,20 +115,28 @@ class BookApp:
             messagebox.showwarning("Invalid Month", "Month should be between 1 and 12.")
             return
          
-        try:
-            database.save_book(data)
+        def on_saved(_):
+            self.refresh_stats()
             messagebox.showinfo("Success", f"'{data[0]}' saved successfully!")
             self.clear_entries()
             self.rating_var.set("")
-        except Exception as e:
-            messagebox.showerror("Database Error", f"Could not save data: {e}")
 
-    def view_database(self):
-        try:
-            self._display_books_window(database.get_books(type = "view"))
-        except Exception as e:
-            messagebox.showerror("Database Error", f"Could not fetch data: {e}")
+        self.worker.submit(
+            database.save_book, data, writes=True,
+            on_success=on_saved,
+            on_error=lambda e: messagebox.showerror("Database Error", f"Could not save data: {e}")
+        )
 
+    @instrument.traced("gui.BookApp.view_database")
+    def view_database(self):
+        pager = database.books_pager(type = "view")
+        self.worker.submit(
+            open_pager, pager,
+            on_success=lambda loaded: self._display_books_window(pager, loaded),
+            on_error=lambda e: messagebox.showerror("Database Error", f"Could not fetch data: {e}")
+        )
+
+    @instrument.traced("gui.BookApp.search_books")
     def search_books(self):
         data = tuple(
             self.entries[key].get().strip() 
@@ -131,23 +149,33 @@ class BookApp:
             messagebox.showwarning("Empty Form", "Please fill in at least a box to search.")
             return
         
-        try:
-            self._display_books_window(database.search_books(data), show_translators = not validation.is_empty(data[6]))
+        def on_counted(loaded):
+            self._display_books_window(pager, loaded, show_translators = not validation.is_empty(data[6]))
             self.clear_entries()
             self.rating_var.set("")
-        except Exception as e:
-            messagebox.showerror("Database Error", f"Could not fetch data: {e}")
 
+        pager = database.search_books_pager(data)
+        self.worker.submit(
+            open_pager, pager,
+            on_success=on_counted,
+            on_error=lambda e: messagebox.showerror("Database Error", f"Could not fetch data: {e}")
+        )
+
+    @instrument.traced("gui.BookApp.delete_last_entry")
     def delete_last_entry(self):
         # Ask for confirmation
         if not messagebox.askyesno("Confirm Delete", "Are you sure you want to delete the last entry?"):
             return  # User clicked "No", so exit the function
-        
-        try:
-            database.delete_last_entry(table="books")
+
+        def on_deleted(_):
+            self.refresh_stats()
             messagebox.showinfo("Success", "Last entry deleted successfully!")
-        except Exception as e:
-            messagebox.showerror("Database Error", f"Could not delete entry: {e}")
+
+        self.worker.submit(
+            database.delete_last_entry, table="books", writes=True,
+            on_success=on_deleted,
+            on_error=lambda e: messagebox.showerror("Database Error", f"Could not delete entry: {e}")
+        )
 
     def clear_entries(self):
         for entry in self.entries.values():
@@ -156,24 +184,73 @@ class BookApp:
             else:
                 entry.delete(0, tk.END)
 
+    @instrument.traced("gui.BookApp.generate_report")
     def generate_report(self):
-        try:
+        def build_report(cancel_event):
+            # Runs on the worker thread. reporting pulls in pandas, matplotlib and fpdf,
+            # so it is only imported once a report is asked for
+            from reporting import report
+            if report.REPORT_BACKEND == "sql":
+                counts = database.get_report_counts(since=report.DATA_SINCE)
+                if not counts["counts"]:
+                    return None
+                return report.generate_report(counts=counts, cancel_event=cancel_event)
             books = database.get_books(type = "all")
             if not books:
+                return None
+            return report.generate_report(books, cancel_event=cancel_event)
+
+        def on_done(output_path):
+            if output_path is None:
                 messagebox.showwarning("No Data", "No books in database to generate report.")
-                return
-            
-            report.generate_report(books)
-            messagebox.showinfo("Success", "Report generated successfully!")
-        except Exception as e:
-            messagebox.showerror("Report Error", f"Could not generate report: {e}")
+            else:
+                messagebox.showinfo("Success", "Report generated successfully!")
+
+        self.worker.submit(
+            build_report, cancellable=True,
+            on_success=on_done,
+            on_error=lambda e: messagebox.showerror("Report Error", f"Could not generate report: {e}")
+        )
 
+    @instrument.traced("gui.BookApp.export_as_csv")
     def export_as_csv(self):
-        try:
-            database.export_as_csv()
-            messagebox.showinfo("Success", "Export successfully!")
-        except Exception as e:
-            messagebox.showerror("Database Error", f"Could not export table: {e}")
+        self.worker.submit(
+            database.export_as_csv,
+            on_progress=self.busy_bar.set_progress,
+            on_success=lambda _: messagebox.showinfo("Success", "Export successfully!"),
+            on_error=lambda e: messagebox.showerror("Database Error", f"Could not export table: {e}")
+        )
+
+    @instrument.traced("gui.BookApp.import_books")
+    def import_books(self):
+        path = filedialog.askopenfilename(
+            parent=self.root, title="Import books",
+            filetypes=[("CSV files", "*.csv *.csv.gz"), ("Calibre library", "metadata.db"), ("All files", "*.*")]
+        )
+        if not path:
+            return
+        on_error = lambda e: messagebox.showerror("Import Error", f"Could not import file: {e}")
+
+        if path.endswith(".db"):
+            def on_calibre_done(counts):
+                imported, skipped = counts
+                self.refresh_stats()
+                messagebox.showinfo("Success", f"Imported {imported} books from Calibre ({skipped} already saved)!")
+            self.worker.submit(calibre.import_calibre_library, path, writes=True,
+                               on_success=on_calibre_done, on_error=on_error)
+            return
+
+        def on_imported(count):
+            self.refresh_stats()
+            messagebox.showinfo("Success", f"Imported {count} books!")
+
+        # Imported books are numbered after the existing ones, so a backup can be loaded into any database
+        self.worker.submit(
+            importer.import_books_csv, path, keep_ids=False, writes=True,
+            on_progress=self.busy_bar.set_progress,
+            on_success=on_imported,
+            on_error=on_error
+        )
 
     def _create_action_buttons(self, parent):
         ttk.Label(parent, text="", style="Header.TLabel").pack(pady=(0, 0))
@@ -183,16 +260,30 @@ class BookApp:
             ("DELETE LAST ENTRY", self.delete_last_entry),
             ("VIEW ALL", self.view_database), 
             ("GENERATE REPORT", self.generate_report),
-            ("EXPORT AS CSV", self.export_as_csv)
+            ("EXPORT AS CSV", self.export_as_csv),
+            ("IMPORT", self.import_books)
         ]:
             btn = ttk.Button(parent, text=text, command=cmd, style="Action.TButton", width=20)
             btn.pack(fill="x", ipady=10, pady=5)
 
+    def _create_stats_panel(self, parent):
+        ttk.Label(parent, text="Stats", style="Header.TLabel").pack(anchor="w", pady=(15, 5))
+        self.stats_var = tk.StringVar(value="Loading...")
+        ttk.Label(parent, textvariable=self.stats_var, justify="left", wraplength=STATS_WRAP).pack(anchor="w")
+
+    def _show_stats(self, stats):
+        lines = [f"This month: {stats['month']}   This year: {stats['year']}   All time: {stats['total']}"]
+        for label, column in [("Genres", "genre"), ("Languages", "language"), ("Ratings", "rating")]:
+            top = ", ".join(f"{name} {count}" for name, count in stats["by"][column][:STATS_TOP])
+            lines.append(f"{label} this year: {top or '-'}")
+        self.stats_var.set("\n".join(lines))
+
     def _create_rating_buttons(self, parent):
         ttk.Label(parent, text="Rating").pack(anchor="w", pady=(0, 2))
         rating_frame = ttk.Frame(parent)
         rating_frame.pack(fill="x", pady=2)
-        for text, color in RATINGS:
+        for text in RATINGS:
+            color = RATING_COLORS[text]
             btn = tk.Button(rating_frame, text=text, bg=color, fg="white", font=FONTS["button"], 
                           command=lambda t=text: self.rating_var.set(t), relief="raised", width=8, height=2)
             btn.pack(side="left", fill="both", expand=True, padx=2)
@@ -248,7 +339,8 @@ class BookApp:
         style.configure("Action.TButton", font=FONTS["button"], foreground="white", background=BUTTON_COLOR)
         style.map("Action.TButton", background=[('active', BUTTON_HOVER_COLOR)])
 
-    def _display_books_window(self, books, show_translators = False):
+    @instrument.traced("gui.BookApp.display_books_window")
+    def _display_books_window(self, pager, loaded, show_translators = False):
         # View window dimensions
         VIEW_WINDOW_WIDTH, VIEW_WINDOW_HEIGHT = 1200, 600
         # View window fonts
@@ -264,9 +356,7 @@ class BookApp:
         view_window.geometry(f"{VIEW_WINDOW_WIDTH}x{VIEW_WINDOW_HEIGHT}")
         view_window.configure(bg=BG_COLOR)
 
-        ttk.Label(view_window, text=f"Total Books: {len(books)}", style="Header.TLabel").pack(pady=10)
-        tree_frame = ttk.Frame(view_window)
-        tree_frame.pack(fill="both", expand=True, padx=10, pady=10)
+        ttk.Label(view_window, text=f"Total Books: {loaded[0]}", style="Header.TLabel").pack(pady=10)
 
         # Shows desired columns
         if show_translators:
@@ -275,27 +365,14 @@ class BookApp:
         else:
             columns = ("title", "author", "time", "language", "genre", "rating")
             headings = {"title": "Title", "author": "Author", "time": "Time", "language": "Language", "genre": "Genre", "rating": "Rating"}
-        tree = ttk.Treeview(tree_frame, columns=columns, height=20, show="headings")
         
         style = ttk.Style()
         style.configure("Treeview", font=VIEW_WINDOW_FONTS["content"])
         style.configure("Treeview.Heading", font=VIEW_WINDOW_FONTS["header"])
 
-        for col, heading in headings.items():
-            tree.heading(col, text=heading)
-            tree.column(col, width=120)
-
-        for book in books:
-            tree.insert("", "end", values=book)
-
-        vsb = ttk.Scrollbar(tree_frame, orient="vertical", command=tree.yview)
-        tree.configure(yscrollcommand=vsb.set)
-
-        tree.grid(row=0, column=0, sticky="nsew")
-        vsb.grid(row=0, column=1, sticky="ns")
-
-        tree_frame.grid_rowconfigure(0, weight=1)
-        tree_frame.grid_columnconfigure(0, weight=1)
+        # Only the rows around the visible ones are loaded; more are fetched while scrolling
+        tree_view = VirtualTreeview(view_window, pager, columns, headings, self.worker, loaded)
+        tree_view.pack(fill="both", expand=True, padx=10, pady=10)
 
         ttk.Button(view_window, text="Close", command=view_window.destroy).pack(pady=10)
 
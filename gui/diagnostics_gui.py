@@ -0,0 +1,64 @@
+import tkinter as tk
+from tkinter import ttk
+from utils import instrument
+
+# Diagnostics window dimensions
+WINDOW_WIDTH, WINDOW_HEIGHT = 900, 500
+REFRESH_MS = 1000  # How often the table reloads while the window is open
+
+COLUMNS = ("name", "count", "errors", "p50", "p90", "p99", "max", "rows", "bytes")
+HEADINGS = {
+    "name": "Operation", "count": "Calls", "errors": "Errors", "p50": "p50 ms", "p90": "p90 ms",
+    "p99": "p99 ms", "max": "Max ms", "rows": "Avg rows", "bytes": "Bytes",
+}
+
+
+class DiagnosticsWindow:
+    """Per-operation timings recorded by utils.instrument, refreshed while open."""
+    def __init__(self, root):
+        self.root = root
+        self.root.title("Diagnostics")
+        self.root.geometry(f"{WINDOW_WIDTH}x{WINDOW_HEIGHT}")
+        self._after_id = None
+
+        main_frame = ttk.Frame(self.root, padding=10)
+        main_frame.pack(expand=True, fill="both")
+
+        controls = ttk.Frame(main_frame)
+        controls.pack(fill="x", pady=(0, 10))
+        self.enabled_var = tk.BooleanVar(value=instrument.ENABLED)
+        ttk.Checkbutton(controls, text="Record timings", variable=self.enabled_var,
+                        command=lambda: instrument.set_enabled(self.enabled_var.get())).pack(side="left")
+        ttk.Button(controls, text="Clear", command=self.clear).pack(side="right")
+        ttk.Button(controls, text="Refresh", command=self.refresh).pack(side="right", padx=5)
+
+        self.tree = ttk.Treeview(main_frame, columns=COLUMNS, show="headings")
+        for col in COLUMNS:
+            self.tree.heading(col, text=HEADINGS[col])
+            self.tree.column(col, width=260 if col == "name" else 70, anchor="w" if col == "name" else "e")
+        vsb = ttk.Scrollbar(main_frame, orient="vertical", command=self.tree.yview)
+        self.tree.configure(yscrollcommand=vsb.set)
+        self.tree.pack(side="left", fill="both", expand=True)
+        vsb.pack(side="right", fill="y")
+
+        self.refresh()
+
+    def refresh(self):
+        if not self.root.winfo_exists():
+            return  # Window closed; stop refreshing
+        if self._after_id is not None:
+            self.root.after_cancel(self._after_id)
+
+        self.tree.delete(*self.tree.get_children())
+        for name, stats in instrument.summary().items():
+            rows = "" if stats["rows"] is None else f"{stats['rows']:.0f}"
+            self.tree.insert("", "end", values=(
+                name, stats["count"], stats["errors"],
+                f"{stats['p50']:.1f}", f"{stats['p90']:.1f}", f"{stats['p99']:.1f}", f"{stats['max']:.1f}",
+                rows, stats["bytes"] or "",
+            ))
+        self._after_id = self.root.after(REFRESH_MS, self.refresh)
+
+    def clear(self):
+        instrument.clear()
+        self.refresh()
@@ -1,9 +1,19 @@
+import sqlite3
+import importlib
+import threading
 import tkinter as tk
-from tkinter import ttk
+from tkinter import ttk, messagebox
+from database import database
 
 # Menu window dimensions
 MENU_WIDTH, MENU_HEIGHT = 600, 500
 
+# Heavy modules imported in the background once the menu is up, so the first report
+# does not wait for pandas and matplotlib. Set PREWARM to False to load them on first use.
+PREWARM = True
+PREWARM_DELAY_MS = 500
+PREWARM_MODULES = ["reporting.report"]
+
 BG_COLOR = "#f0f2f5"
 HEADER_COLOR = "#2c3e50"
 BUTTON_COLOR = "#16A085"
@@ -15,6 +25,14 @@ FONTS = {
     "button": ("Segoe UI", 14, "bold"),
 }
 
+def prewarm(modules=PREWARM_MODULES):
+    """Import modules ahead of use; a module that fails to import is left for its first use to report."""
+    for name in modules:
+        try:
+            importlib.import_module(name)
+        except Exception:
+            pass
+
 class MyMediaMenu:
     def __init__(self, root):
         self.root = root
@@ -53,6 +71,12 @@ class MyMediaMenu:
                            style="Menu.TButton", width=25)
             btn.pack(pady=10, ipady=15)
 
+        # Hidden timing window for tracking down slow clicks
+        self.root.bind_all("<Control-Shift-D>", lambda event: self.open_diagnostics())
+
+        if PREWARM:
+            self.root.after(PREWARM_DELAY_MS, self._start_prewarm)
+
     def open_books(self):
         """Open the Books GUI"""
         self.root.withdraw()  # Hide menu window
@@ -77,8 +101,20 @@ class MyMediaMenu:
         # Show menu again when shows window is closed
         shows_window.protocol("WM_DELETE_WINDOW", lambda: self._on_close_child(shows_window))
 
+    def open_diagnostics(self):
+        """Open the Diagnostics window (Ctrl+Shift+D from any window)"""
+        from gui import diagnostics_gui
+        diagnostics_gui.DiagnosticsWindow(tk.Toplevel(self.root))
+
+    def _start_prewarm(self):
+        threading.Thread(target=prewarm, name="mymedia-prewarm", daemon=True).start()
+
     def _on_close_child(self, child_window):
         """Handle closing of child windows and return to menu"""
+        try:
+            database.flush_writes(check=True)  # Commit saves still waiting, and report any that failed
+        except sqlite3.Error as e:
+            messagebox.showerror("Database Error", f"Could not save data: {e}")
         child_window.destroy()
         self.root.deiconify()  # Show menu window again
 
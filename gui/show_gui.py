@@ -1,7 +1,10 @@
 import tkinter as tk
-from tkinter import ttk, messagebox
-from database import database
-from utils import validation
+from tkinter import ttk, messagebox, filedialog
+from database import database, importer
+from utils import instrument, validation
+from utils.constants import TYPES
+from gui.virtual_tree import VirtualTreeview, open_pager
+from gui.worker import BackgroundWorker, BusyBar
 
 # Home window dimensions
 WINDOW_WIDTH, WINDOW_HEIGHT, PADDING = 1000, 600, 30
@@ -25,14 +28,8 @@ FONTS = {
     "button": ("Segoe UI", 10, "bold"),
 }
 
-TYPES = [
-    'Anime',
-    'Cartoon', 
-    'Comedy',          # Covers sitcoms, stand-up, comedy series
-    'Drama',
-    'Documentary',
-    'Others'
-]
+# Stats panel: categories listed, and where its text wraps
+STATS_TOP, STATS_WRAP = 3, 380
 
 class ShowApp:
     def __init__(self, root):
@@ -62,7 +59,25 @@ class ShowApp:
         self.entries, self.entry_list = {}, []
         self._create_form_fields(left_frame)
         self._create_action_buttons(right_frame)
+        self._create_stats_panel(right_frame)
+
+        # Database calls run on a worker thread so the window never freezes
+        self.busy_bar = BusyBar(main_frame, on_cancel=self.cancel_jobs)
+        self.worker = BackgroundWorker(self.root, on_busy=self.busy_bar.set_busy)
+        self.refresh_stats()
+
+    def cancel_jobs(self):
+        self.worker.cancel_all()
+
+    def refresh_stats(self):
+        # Read from the rollup tables, so this stays instant however large the library grows
+        self.worker.submit(
+            database.get_stats, "shows",
+            on_success=self._show_stats,
+            on_error=lambda e: self.stats_var.set(f"Could not load stats: {e}")
+        )
 
+    @instrument.traced("gui.ShowApp.submit_show")
     def submit_show(self):
         # Data collection with 10 items
         data = tuple(
@@ -91,19 +106,36 @@ class ShowApp:
             return
 
         
-        try:
-            database.save_show(data)
+        def on_saved(_):
+            self.refresh_stats()
             messagebox.showinfo("Success", f"'{data[0]}' saved successfully!")
             self.clear_entries()
-        except Exception as e:
-            messagebox.showerror("Database Error", f"Could not save data: {e}")
 
+        self.worker.submit(
+            database.save_show, data, writes=True,
+            on_success=on_saved,
+            on_error=lambda e: messagebox.showerror("Database Error", f"Could not save data: {e}")
+        )
+
+    @instrument.traced("gui.ShowApp.view_database")
     def view_database(self):
-        try:
-            self._display_shows_window(database.get_shows())
-        except Exception as e:
-            messagebox.showerror("Database Error", f"Could not fetch data: {e}")
+        pager = database.shows_pager()
+        self.worker.submit(
+            open_pager, pager,
+            on_success=lambda loaded: self._display_shows_window(pager, loaded),
+            on_error=lambda e: messagebox.showerror("Database Error", f"Could not fetch data: {e}")
+        )
+
+    @instrument.traced("gui.ShowApp.view_series")
+    def view_series(self):
+        pager = database.series_pager()
+        self.worker.submit(
+            open_pager, pager,
+            on_success=lambda loaded: self._display_series_window(pager, loaded),
+            on_error=lambda e: messagebox.showerror("Database Error", f"Could not fetch data: {e}")
+        )
 
+    @instrument.traced("gui.ShowApp.search_shows")
     def search_shows(self):
         data = tuple(
             self.entries[key].get().strip() 
@@ -115,26 +147,33 @@ class ShowApp:
         if all(validation.is_empty(data[i]) for i in range(6)):
             messagebox.showwarning("Empty Form", "Please fill in at least a box to search.")
             return
-        if validation.is_empty(data[0]) and not validation.is_empty(data[1]):
-            messagebox.showwarning("Incomplete Input", "Please enter a title when searching by season.")
-            return
         
-        try:
-            self._display_shows_window(database.search_shows(data))
+        def on_counted(loaded):
+            self._display_shows_window(pager, loaded)
             self.clear_entries()
-        except Exception as e:
-            messagebox.showerror("Database Error", f"Could not fetch data: {e}")
 
+        pager = database.search_shows_pager(data)
+        self.worker.submit(
+            open_pager, pager,
+            on_success=on_counted,
+            on_error=lambda e: messagebox.showerror("Database Error", f"Could not fetch data: {e}")
+        )
+
+    @instrument.traced("gui.ShowApp.delete_last_entry")
     def delete_last_entry(self):
         # Ask for confirmation
         if not messagebox.askyesno("Confirm Delete", "Are you sure you want to delete the last entry?"):
             return  # User clicked "No", so exit the function
-        
-        try:
-            database.delete_last_entry(table="shows")
+
+        def on_deleted(_):
+            self.refresh_stats()
             messagebox.showinfo("Success", "Last entry deleted successfully!")
-        except Exception as e:
-            messagebox.showerror("Database Error", f"Could not delete entry: {e}")
+
+        self.worker.submit(
+            database.delete_last_entry, table="shows", writes=True,
+            on_success=on_deleted,
+            on_error=lambda e: messagebox.showerror("Database Error", f"Could not delete entry: {e}")
+        )
 
     def clear_entries(self):
         for entry in self.entries.values():
@@ -143,17 +182,51 @@ class ShowApp:
             else:
                 entry.delete(0, tk.END)
 
+    @instrument.traced("gui.ShowApp.import_csv")
+    def import_csv(self):
+        path = filedialog.askopenfilename(
+            parent=self.root, title="Import shows",
+            filetypes=[("CSV files", "*.csv *.csv.gz"), ("All files", "*.*")]
+        )
+        if not path:
+            return
+        def on_imported(count):
+            self.refresh_stats()
+            messagebox.showinfo("Success", f"Imported {count} shows!")
+
+        # Imported shows are numbered after the existing ones, so a backup can be loaded into any database
+        self.worker.submit(
+            importer.import_shows_csv, path, keep_ids=False, writes=True,
+            on_progress=self.busy_bar.set_progress,
+            on_success=on_imported,
+            on_error=lambda e: messagebox.showerror("Import Error", f"Could not import file: {e}")
+        )
+
     def _create_action_buttons(self, parent):
         ttk.Label(parent, text="", style="Header.TLabel").pack(pady=(0, 0))
         for text, cmd in [
             ("SAVE", self.submit_show), 
             ("SEARCH", self.search_shows),
             ("DELETE LAST ENTRY", self.delete_last_entry),
-            ("VIEW ALL", self.view_database)
+            ("VIEW ALL", self.view_database),
+            ("VIEW SERIES", self.view_series),
+            ("IMPORT CSV", self.import_csv)
         ]:
             btn = ttk.Button(parent, text=text, command=cmd, style="Action.TButton", width=20)
             btn.pack(fill="x", ipady=10, pady=5)
 
+    def _create_stats_panel(self, parent):
+        ttk.Label(parent, text="Stats", style="Header.TLabel").pack(anchor="w", pady=(15, 5))
+        self.stats_var = tk.StringVar(value="Loading...")
+        ttk.Label(parent, textvariable=self.stats_var, justify="left", wraplength=STATS_WRAP).pack(anchor="w")
+
+    def _show_stats(self, stats):
+        types = ", ".join(f"{name} {count}" for name, count in stats["by"]["type"][:STATS_TOP])
+        self.stats_var.set(
+            f"This month: {stats['month']}   This year: {stats['year']}   All time: {stats['total']}\n"
+            f"Types this year: {types or '-'}"
+        )
+
     def _create_form_fields(self, parent):
         for item in FORM_FIELDS:
             if isinstance(item, list):
@@ -203,7 +276,8 @@ class ShowApp:
         style.configure("Action.TButton", font=FONTS["button"], foreground="white", background=BUTTON_COLOR)
         style.map("Action.TButton", background=[('active', BUTTON_HOVER_COLOR)])
 
-    def _display_shows_window(self, shows):
+    @instrument.traced("gui.ShowApp.display_shows_window")
+    def _display_shows_window(self, pager, loaded):
         # View window dimensions
         VIEW_WINDOW_WIDTH, VIEW_WINDOW_HEIGHT = 1000, 600
         # View window fonts
@@ -217,36 +291,63 @@ class ShowApp:
         view_window.geometry(f"{VIEW_WINDOW_WIDTH}x{VIEW_WINDOW_HEIGHT}")
         view_window.configure(bg=BG_COLOR)
 
-        ttk.Label(view_window, text=f"Total Shows/Movies: {len(shows)}", style="Header.TLabel").pack(pady=10)
-        tree_frame = ttk.Frame(view_window)
-        tree_frame.pack(fill="both", expand=True, padx=10, pady=10)
+        ttk.Label(view_window, text=f"Total Shows/Movies: {loaded[0]}", style="Header.TLabel").pack(pady=10)
 
         # Shows desired columns
         
         columns = ("title", "time", "type")
         headings = {"title": "Title", "time": "Time", "type": "Type"}
-        tree = ttk.Treeview(tree_frame, columns=columns, height=20, show="headings")
         
         style = ttk.Style()
         style.configure("Treeview", font=VIEW_WINDOW_FONTS["content"])
         style.configure("Treeview.Heading", font=VIEW_WINDOW_FONTS["header"])
 
-        for col, heading in headings.items():
-            tree.heading(col, text=heading)
-            tree.column(col, width=120)
+        # Only the rows around the visible ones are loaded; more are fetched while scrolling
+        tree_view = VirtualTreeview(view_window, pager, columns, headings, self.worker, loaded)
+        tree_view.pack(fill="both", expand=True, padx=10, pady=10)
 
-        for show in shows:
-            tree.insert("", "end", values=show)
-
-        vsb = ttk.Scrollbar(tree_frame, orient="vertical", command=tree.yview)
-        tree.configure(yscrollcommand=vsb.set)
-
-        tree.grid(row=0, column=0, sticky="nsew")
-        vsb.grid(row=0, column=1, sticky="ns")
+        ttk.Button(view_window, text="Close", command=view_window.destroy).pack(pady=10)
 
-        tree_frame.grid_rowconfigure(0, weight=1)
-        tree_frame.grid_columnconfigure(0, weight=1)
+    @instrument.traced("gui.ShowApp.display_series_window")
+    def _display_series_window(self, pager, loaded):
+        view_window = tk.Toplevel(self.root)
+        view_window.title("Series")
+        view_window.geometry("1000x700")
+        view_window.configure(bg=BG_COLOR)
 
+        ttk.Label(view_window, text=f"Total Series/Movies: {loaded[0]}", style="Header.TLabel").pack(pady=10)
+
+        # One row per series, paged like VIEW ALL; picking one lists its seasons below
+        columns = ("series", "entries", "first", "last")
+        headings = {"series": "Series", "entries": "Entries", "first": "First Watched", "last": "Last Watched"}
+        series_view = VirtualTreeview(view_window, pager, columns, headings, self.worker, loaded, height=12)
+        series_view.pack(fill="both", expand=True, padx=10, pady=(0, 5))
+
+        season_columns = ("season", "time", "type", "note")
+        seasons = ttk.Treeview(view_window, columns=season_columns, height=8, show="headings")
+        for col, heading in zip(season_columns, ("Season", "Time", "Type", "Note")):
+            seasons.heading(col, text=heading)
+            seasons.column(col, width=120)
+        seasons.pack(fill="both", expand=True, padx=10, pady=5)
+
+        def show_seasons(series):
+            seasons.delete(*seasons.get_children())
+            for season, _, time, type, note in series["seasons"]:
+                seasons.insert("", "end", values=("" if season is None else season, time, type, note or ""))
+
+        def on_select(_):
+            selected = series_view.tree.selection()
+            if not selected:
+                return
+            # set() returns the text as stored; values would turn a series named "1984" into a number
+            series = series_view.tree.set(selected[0], "series")
+            self.worker.submit(
+                database.get_series, series,
+                on_success=show_seasons,
+                on_error=lambda e: messagebox.showerror("Database Error", f"Could not fetch data: {e}")
+            )
+
+        series_view.tree.bind("<<TreeviewSelect>>", on_select)
         ttk.Button(view_window, text="Close", command=view_window.destroy).pack(pady=10)
 
 
@@ -0,0 +1,166 @@
+from tkinter import ttk, messagebox
+from collections import OrderedDict
+
+WINDOW_PAGES = 3    # Pages held in the Treeview at once: the visible one plus one either side
+CACHED_PAGES = 8    # Pages kept in memory so scrolling back and forth does not refetch
+
+
+def fetch_pages(pager, wanted, known):
+    """Fetch the pages of pager numbered in wanted that known (page index -> Page) lacks.
+
+    Walks from a neighbouring page by key when there is one and seeks by offset otherwise.
+    Only reads the database, so it runs on a worker thread. Returns {index: Page} for the
+    new pages, stopping at the end of the results.
+    """
+    fetched = {}
+    for index in wanted:
+        if index in known:
+            continue
+        previous = fetched.get(index - 1, known.get(index - 1))
+        following = known.get(index + 1)
+        if previous is not None:
+            page = pager.next(previous) if previous.has_next else None
+        elif following is not None:
+            page = pager.previous(following)
+        else:
+            page = pager.seek(index * pager.page_size)
+        if page is None or not page.rows:
+            break
+        fetched[index] = page
+    return fetched
+
+def open_pager(pager):
+    """Count pager's rows and fetch the pages a VirtualTreeview shows first.
+
+    Run it on the worker and hand the (total, pages) it returns to VirtualTreeview.
+    """
+    total = pager.count()
+    return total, (fetch_pages(pager, range(WINDOW_PAGES), {}) if total else {})
+
+
+class VirtualTreeview(ttk.Frame):
+    """A Treeview that only holds the rows around the visible ones.
+
+    Rows come from a database.KeysetPager. The scrollbar spans the whole result (sized from
+    a COUNT query) and pages are fetched as it moves, so opening the window costs the same
+    for ten books or a million. loaded is what open_pager returned; the pages needed later
+    are fetched through worker (a BackgroundWorker), never on the Tk thread.
+    """
+    def __init__(self, parent, pager, columns, headings, worker, loaded, height=20):
+        super().__init__(parent)
+        self.pager = pager
+        self.worker = worker
+        self.total, pages = loaded
+        self.pages = OrderedDict(sorted(pages.items()))  # page index -> Page
+        self.start, self.loaded = 0, 0  # Global index of the first row in the widget, rows in the widget
+        self.indexes = []               # Page indexes in the widget
+        self.job = None                 # The fetch running on the worker, if any
+        self.wanted = 0                 # Row to show once it is done
+
+        self.tree = ttk.Treeview(self, columns=columns, height=height, show="headings")
+        for col, heading in headings.items():
+            self.tree.heading(col, text=heading)
+            self.tree.column(col, width=120)
+
+        self.vsb = ttk.Scrollbar(self, orient="vertical", command=self._on_scrollbar)
+        self.tree.configure(yscrollcommand=self._on_tree_scroll)
+
+        self.tree.grid(row=0, column=0, sticky="nsew")
+        self.vsb.grid(row=0, column=1, sticky="ns")
+        self.grid_rowconfigure(0, weight=1)
+        self.grid_columnconfigure(0, weight=1)
+
+        self._load_window(0)
+
+    def _window(self, row):
+        """The page indexes shown around global row index row."""
+        size = self.pager.page_size
+        first = max(0, row // size - WINDOW_PAGES // 2)
+        return [index for index in range(first, first + WINDOW_PAGES) if index * size < self.total]
+
+    def _load_window(self, row):
+        """Show the pages around global row index row, fetching missing ones on the worker first."""
+        indexes = self._window(row)
+        if all(index in self.pages for index in indexes):
+            self._fill(indexes, row)
+            return
+        self.wanted = row
+        if self.job is not None and not self.job.cancelled:
+            return  # The running fetch picks up the latest wanted row when it is done
+        self.job = self.worker.submit(
+            fetch_pages, self.pager, indexes, dict(self.pages),
+            on_success=lambda pages: self._on_fetched(indexes, pages),
+            on_error=self._on_fetch_error
+        )
+
+    def _on_fetched(self, indexes, pages):
+        self.job = None
+        if not self.winfo_exists():
+            return
+        self.pages.update(pages)
+        if self._window(self.wanted) == indexes:
+            self._fill(indexes, self.wanted)  # Pages past the end of the results stay missing
+        else:
+            self._load_window(self.wanted)    # Scrolled elsewhere while fetching
+
+    def _on_fetch_error(self, error):
+        self.job = None
+        if self.winfo_exists():
+            messagebox.showerror("Database Error", f"Could not fetch data: {error}", parent=self)
+
+    def _fill(self, indexes, row):
+        """Refill the Treeview with the cached pages indexes and scroll to global row index row."""
+        rows = []
+        for index in indexes:
+            page = self.pages.get(index)
+            if page is None:
+                break
+            self.pages.move_to_end(index)
+            rows.extend(page.rows)
+        while len(self.pages) > CACHED_PAGES:
+            self.pages.popitem(last=False)
+
+        self.tree.delete(*self.tree.get_children())
+        for values in rows:
+            self.tree.insert("", "end", values=values)
+        self.start = indexes[0] * self.pager.page_size if indexes else 0
+        self.loaded, self.indexes = len(rows), indexes
+        if rows:
+            self.tree.yview_moveto((row - self.start) / self.loaded)
+
+    def _on_tree_scroll(self, first, last):
+        """Map the Treeview's local position onto the scrollbar, shifting the window near its edges."""
+        first, last = float(first), float(last)
+        if not self.total or not self.loaded:
+            self.vsb.set(0, 1)
+            return
+
+        top = self.start + first * self.loaded
+        bottom = self.start + last * self.loaded
+        self.vsb.set(top / self.total, bottom / self.total)
+
+        margin = self.pager.page_size / 2
+        near_top = first * self.loaded < margin and self.start > 0
+        near_bottom = (1 - last) * self.loaded < margin and self.start + self.loaded < self.total
+        if (near_top or near_bottom) and self._window(int(top)) != self.indexes:
+            self._load_window(int(top))
+
+    def _on_scrollbar(self, *args):
+        if not self.loaded:
+            return
+        first, last = self.tree.yview()
+        top = self.start + first * self.loaded
+        visible = max(1, round((last - first) * self.loaded))
+
+        if args[0] == "moveto":
+            target = float(args[1]) * self.total
+        else:
+            # ("scroll", n, "units" | "pages")
+            step = 1 if args[2] == "units" else visible
+            target = top + int(args[1]) * step
+        target = int(max(0, min(target, self.total - visible)))
+
+        if self.start <= target and target + visible <= self.start + self.loaded:
+            self.tree.yview_moveto((target - self.start) / self.loaded)
+        else:
+            self._load_window(target)
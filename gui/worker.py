@@ -0,0 +1,191 @@
+import time
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from tkinter import ttk
+from database import database
+from utils import instrument
+
+POLL_MS = 50  # How often the Tk thread checks for finished jobs
+
+
+class Job:
+    """Handle for a call submitted to a BackgroundWorker."""
+    def __init__(self):
+        self.future = None
+        self.name = None
+        self.on_progress = None
+        self.progress = None  # Latest (done, total) reported by the job, read on the Tk thread
+        self.reported = None
+        self.submitted = time.perf_counter()
+        self.cancel_event = threading.Event()
+        self.conn = None  # The worker thread's database connection, once the job starts
+        self.writes = False  # Changes the database, so closing the window lets it finish
+
+    @property
+    def cancelled(self):
+        return self.cancel_event.is_set()
+
+    def cancel(self):
+        """Drop the job if it has not started, otherwise ask it to stop.
+
+        A running database query is interrupted; a long job that takes a cancel_event
+        stops at its next check. Its callbacks are never called.
+        """
+        self.cancel_event.set()
+        if self.future is None:
+            return
+        self.future.cancel()
+        if self.future.running() and self.conn is not None:
+            self.conn.interrupt()
+
+
+class BackgroundWorker:
+    """Run blocking database and reporting calls off the Tk thread.
+
+    Finished jobs are queued and handed back to their callbacks on the Tk thread by
+    polling with after(), so callbacks may safely touch widgets and show message boxes.
+    """
+    def __init__(self, root, on_busy=None, max_workers=1):
+        self.root = root
+        self.on_busy = on_busy
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="mymedia-worker")
+        self.finished = queue.Queue()
+        self.jobs = set()
+        self.closed = False
+        self._polling = False
+        root.bind("<Destroy>", self._on_destroy, add="+")
+
+    def submit(self, fn, *args, on_success=None, on_error=None, cancellable=False, on_progress=None,
+               writes=False, **kwargs):
+        """Run fn(*args, **kwargs) on the worker thread.
+
+        on_success(result) or on_error(exception) is then called on the Tk thread.
+        Pass writes=True for saves, deletes and imports: when the window closes they
+        still run to the end, while reads and reports are cancelled.
+        With cancellable=True, fn also receives the job's cancel_event keyword argument.
+        With on_progress, fn receives a progress(done, total) keyword argument, and
+        on_progress(done, total) is called on the Tk thread with the latest values.
+        """
+        job = Job()
+        job.name = f"job.{getattr(fn, '__qualname__', type(fn).__name__)}"
+        job.writes = writes
+        if cancellable:
+            kwargs["cancel_event"] = job.cancel_event
+        if on_progress is not None:
+            job.on_progress = on_progress
+            kwargs["progress"] = lambda done, total: setattr(job, "progress", (done, total))
+
+        def run():
+            job.conn = database.get_connection()
+            if job.cancelled:
+                return None
+            return fn(*args, **kwargs)
+
+        job.future = self.executor.submit(run)
+        job.future.add_done_callback(lambda future: self.finished.put((job, on_success, on_error)))
+        self.jobs.add(job)
+        if not self._polling:
+            self._polling = True
+            self._set_busy(True)
+            self.root.after(POLL_MS, self._poll)
+        return job
+
+    def cancel_all(self):
+        for job in list(self.jobs):
+            job.cancel()
+
+    def shutdown(self):
+        """Stop for good: cancel reads and reports, but let queued and running writes finish.
+
+        Their callbacks are not called any more; failures still show up in the
+        instrument log. Once they are done, saves waiting for a group commit are flushed
+        and the worker thread closes its database connection.
+        """
+        self.closed = True
+        writes = False
+        for job in list(self.jobs):
+            if job.writes:
+                writes = True
+            else:
+                job.cancel()
+        if writes:
+            self.executor.submit(database.flush_writes)
+        # Last in the queue, so it runs on the (single) worker thread after everything else
+        self.executor.submit(database.close_connection)
+        self.executor.shutdown(wait=False)
+
+    def _poll(self):
+        if self.closed:
+            return
+        for job in list(self.jobs):
+            progress = job.progress
+            if job.on_progress is not None and progress != job.reported and not job.cancelled:
+                job.reported = progress
+                job.on_progress(*progress)
+        while True:
+            try:
+                job, on_success, on_error = self.finished.get_nowait()
+            except queue.Empty:
+                break
+            self.jobs.discard(job)
+            if job.cancelled:
+                continue
+            error = job.future.exception()
+            # From the click to the result reaching the Tk thread, queueing included
+            instrument.record(job.name, (time.perf_counter() - job.submitted) * 1000,
+                              error=type(error).__name__ if error else None)
+            if error is not None:
+                if on_error is not None:
+                    on_error(error)
+            elif on_success is not None:
+                on_success(job.future.result())
+
+        if self.jobs:
+            self.root.after(POLL_MS, self._poll)
+        else:
+            self._polling = False
+            self._set_busy(False)
+
+    def _set_busy(self, busy):
+        self.root.configure(cursor="watch" if busy else "")
+        if self.on_busy is not None:
+            self.on_busy(busy)
+
+    def _on_destroy(self, event):
+        # <Destroy> also fires for every child widget of the window
+        if event.widget is self.root:
+            self.shutdown()
+
+
+class BusyBar(ttk.Frame):
+    """Status line shown while a BackgroundWorker has jobs: a spinner and a Cancel button."""
+    def __init__(self, parent, on_cancel):
+        super().__init__(parent)
+        self.label = ttk.Label(self, text="Working...")
+        self.progress = ttk.Progressbar(self, mode="indeterminate", length=200)
+        self.cancel_button = ttk.Button(self, text="Cancel", command=on_cancel)
+        self.label.pack(side="left", padx=(0, 10))
+        self.progress.pack(side="left", fill="x", expand=True)
+        self.cancel_button.pack(side="left", padx=(10, 0))
+
+    def set_busy(self, busy):
+        if busy:
+            self.pack(side="bottom", fill="x", pady=(10, 0))
+            self.progress.configure(mode="indeterminate")
+            self.progress.start(10)
+        else:
+            self.progress.stop()
+            self.label.configure(text="Working...")
+            self.pack_forget()
+
+    def set_progress(self, done, total):
+        """Show how far along a job is; a total of None keeps the spinner and only counts rows."""
+        if total is None:
+            self.label.configure(text=f"{done:,} rows")
+            return
+        if str(self.progress.cget("mode")) != "determinate":
+            self.progress.stop()
+            self.progress.configure(mode="determinate", maximum=max(total, 1))
+        self.progress.configure(value=done)
+        self.label.configure(text=f"{done:,} / {total:,}")
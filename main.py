@@ -1,3 +1,4 @@
+import multiprocessing
 import tkinter as tk
 from gui.menu_gui import MyMediaMenu
 from database import database
@@ -11,5 +12,10 @@ def main():
     app = MyMediaMenu(root)
     root.mainloop()
 
+    # 3. Release the long-lived database connections
+    database.close_all_connections()
+
 if __name__ == "__main__":
+    # Lets report plot worker processes start from the bundled executable
+    multiprocessing.freeze_support()
     main()
\ No newline at end of file
@@ -0,0 +1,78 @@
+import pandas as pd
+
+# Columns of ReportAggregates.counts besides the count itself
+GROUP_COLUMNS = ["year", "month", "lang", "genre", "rating"]
+
+
+class ReportAggregates:
+    """Every count the report draws, computed once up front.
+
+    counts holds one row per (year, month, lang, genre, rating) combination with the
+    number of books in it, so every breakdown the plots need is a sum over a frame
+    whose size depends on the number of categories, not the number of books.
+    authors holds the number of books per author, most read first.
+    """
+    def __init__(self, counts, authors):
+        self.counts = counts
+        self.authors = authors
+
+    @classmethod
+    def from_frame(cls, df):
+        """Build from prepare_data's output in a single groupby pass (plus one for authors)."""
+        counts = df.groupby(GROUP_COLUMNS, observed=True).size().reset_index(name="count")
+        # Plain labels, so both constructors give the same aggregates (and plot cache keys)
+        for column in ["lang", "genre", "rating"]:
+            counts[column] = counts[column].astype(object)
+        counts = counts.astype({"year": "int64", "month": "int64"})
+        authors = df["author"].value_counts()
+        authors.index = authors.index.astype(object)
+        return cls(counts, authors)
+
+    @classmethod
+    def from_counts(cls, counts_rows, author_rows):
+        """Build from the rows of database.get_report_counts, already grouped in SQLite."""
+        counts = pd.DataFrame(counts_rows, columns=GROUP_COLUMNS + ["count"])
+        authors = pd.Series(
+            [count for _, count in author_rows],
+            index=pd.Index([author for author, _ in author_rows], name="author"),
+            name="count",
+            dtype="int64",
+        )
+        return cls(counts, authors)
+
+    def _for_year(self, year):
+        if year is None:
+            return self.counts
+        return self.counts[self.counts["year"] == year]
+
+    def _count_by(self, column, year=None):
+        counts = self._for_year(year).groupby(column, observed=True)["count"].sum()
+        counts = counts[counts > 0].sort_values(ascending=False, kind="stable")
+        counts.name = "count"
+        return counts
+
+    def total(self, year=None):
+        return int(self._for_year(year)["count"].sum())
+
+    def languages(self, year=None):
+        return self._count_by("lang", year)
+
+    def genres(self, year=None):
+        return self._count_by("genre", year)
+
+    def ratings(self, year=None):
+        return self._count_by("rating", year)
+
+    def monthly(self, year):
+        """Books per month of year, for months 1 to 12."""
+        return (
+            self._for_year(year).groupby("month")["count"].sum()
+            .reindex(range(1, 13), fill_value=0)  # Ensure all 12 months exist
+        )
+
+    def yearly(self):
+        """Books per year, oldest first."""
+        return self.counts.groupby("year")["count"].sum().sort_index()
+
+    def top_authors(self, n=5):
+        return self.authors.head(n)
@@ -1,11 +1,17 @@
 import os
 import sys
+import time
+import hashlib
+from io import BytesIO
+import matplotlib
+# Plots are only written to files, and may be drawn off the Tk thread
+matplotlib.use("Agg")
 import seaborn as sns
 import matplotlib.pyplot as plt
 import pandas as pd
+from utils import instrument
  
 # Set font to support Chinese characters
-import matplotlib
 matplotlib.rc('font', family='Microsoft YaHei') 
 
 
@@ -20,19 +26,97 @@ def get_base_dir():
 BASE_DIR = get_base_dir()
 PLOTS_DIR = os.path.join(BASE_DIR, "plots")
 REPORTS_DIR = os.path.join(BASE_DIR, "reports")
-os.makedirs(PLOTS_DIR, exist_ok=True)
-os.makedirs(REPORTS_DIR, exist_ok=True)
 
 PALETTE = "Set2"
 
+# Rendered plots are cached by a hash of the data they draw plus their style, so an
+# unchanged chart is never redrawn. Bump PLOT_CACHE_VERSION when a plot's look changes.
+PLOT_CACHE_DIR = os.path.join(PLOTS_DIR, "cache")
+PLOT_CACHE_VERSION = 1
+PLOT_CACHE_MAX_BYTES = 50 * 1024 * 1024
+PLOT_CACHE_MAX_AGE = 90 * 24 * 3600  # Seconds since the plot was last used
+
+
+# ===== PLOT CACHE =====
+
+def plot_cache_key(name, data, **style):
+    """Hash of the plot name, its input aggregate (a Series or DataFrame) and its style parameters."""
+    digest = hashlib.sha256()
+    digest.update(f"{PLOT_CACHE_VERSION}|{name}|{sorted(style.items())}|{PALETTE}".encode())
+    digest.update(str(matplotlib.rcParams["font.family"]).encode())
+    digest.update(data.to_json().encode())
+    return digest.hexdigest()[:32]
+
+def cached_plot(key, in_memory=False):
+    """Return the cached image for key (a path, or a BytesIO if in_memory), or None on a miss."""
+    plot_file = os.path.join(PLOT_CACHE_DIR, f"{key}.png")
+    try:
+        os.utime(plot_file)  # Mark as recently used for prune_plot_cache
+        if not in_memory:
+            return plot_file
+        with open(plot_file, "rb") as f:
+            return BytesIO(f.read())
+    except FileNotFoundError:
+        return None
+
+def save_plot(key, in_memory=False):
+    """Save and close the current figure as the cached image for key.
+
+    Returns the cached file's path, or with in_memory a BytesIO of the PNG that can go
+    straight to FPDF without being read back from disk.
+    """
+    plot_file = os.path.join(PLOT_CACHE_DIR, f"{key}.png")
+    buffer = BytesIO()
+    plt.savefig(buffer, format="png", bbox_inches='tight')
+    plt.close()
+
+    # Write to a temporary name first so a concurrent reader never sees half a file
+    os.makedirs(PLOT_CACHE_DIR, exist_ok=True)
+    tmp_file = f"{plot_file}.{os.getpid()}.tmp"
+    with open(tmp_file, "wb") as f:
+        f.write(buffer.getbuffer())
+    os.replace(tmp_file, plot_file)
+
+    if in_memory:
+        buffer.seek(0)
+        return buffer
+    return plot_file
+
+def prune_plot_cache(max_bytes=PLOT_CACHE_MAX_BYTES, max_age=PLOT_CACHE_MAX_AGE):
+    """Delete cached plots unused for max_age seconds, then the least recently used until under max_bytes."""
+    if not os.path.isdir(PLOT_CACHE_DIR):
+        return
+    entries = []
+    for entry in os.scandir(PLOT_CACHE_DIR):
+        if entry.is_file() and entry.name.endswith(".png"):
+            stat = entry.stat()
+            entries.append((stat.st_mtime, stat.st_size, entry.path))
+    entries.sort()
+
+    now = time.time()
+    total = sum(size for _, size, _ in entries)
+    for mtime, size, path in entries:
+        if now - mtime <= max_age and total <= max_bytes:
+            break
+        try:
+            os.remove(path)
+        except OSError:
+            continue
+        total -= size
+
 
 # ===== YEARLY SUMMARY PLOTS =====
+# Every plot draws precomputed counts from a reporting.aggregates.ReportAggregates
 
-def create_yearly_language_plot(df, year):
+@instrument.traced("plot.create_yearly_language_plot")
+def create_yearly_language_plot(aggregates, year, in_memory=False):
     """Pie chart of languages read in a specific year"""
-
-    df_year = df[df['time'].dt.year == year]
-    lang_count = df_year['lang'].value_counts()
+    lang_count = aggregates.languages(year)
+    
+    key = plot_cache_key("create_yearly_language_plot", lang_count, year=year)
+    cached = cached_plot(key, in_memory)
+    if cached is not None:
+        return cached
     
     plt.figure(figsize=(5, 5))
     plt.pie(
@@ -43,30 +127,29 @@ def create_yearly_language_plot(df, year):
         colors=sns.color_palette("Set2", n_colors=len(lang_count))
     )
     plt.title(f"Languages Read in {year}")
-    plot_file = os.path.join(PLOTS_DIR, f"yearly_language_{year}.png")
-    plt.savefig(plot_file, bbox_inches='tight')
-    plt.close()
-    return plot_file
+    return save_plot(key, in_memory)
 
-def create_yearly_genre_plot(df, year):
+@instrument.traced("plot.create_yearly_genre_plot")
+def create_yearly_genre_plot(aggregates, year, in_memory=False):
     """Bar chart of genres read in a specific year"""
-    df_year = df[df['time'].dt.year == year]
-    genre_count = df_year['genre'].value_counts()
+    genre_count = aggregates.genres(year)
+    
+    key = plot_cache_key("create_yearly_genre_plot", genre_count, year=year)
+    cached = cached_plot(key, in_memory)
+    if cached is not None:
+        return cached
     
     plt.figure(figsize=(8, 5))
     sns.barplot(x=genre_count.values, y=genre_count.index, hue=genre_count.index, palette= PALETTE)
     plt.title(f"Genres Read in {year}")
     plt.xlabel("Number of Books")
     plt.ylabel("Genre")
-    plot_file = os.path.join(PLOTS_DIR, f"yearly_genre_{year}.png")
-    plt.savefig(plot_file, bbox_inches='tight')
-    plt.close()
-    return plot_file
+    return save_plot(key, in_memory)
 
-def create_yearly_rating_plot(df, year):
+@instrument.traced("plot.create_yearly_rating_plot")
+def create_yearly_rating_plot(aggregates, year, in_memory=False):
     """Bar chart of ratings in a specific year"""
-    df_year = df[df['time'].dt.year == year]
-    rating_count = df_year['rating'].value_counts()
+    rating_count = aggregates.ratings(year)
     
     # Define rating order and colors
     rating_order = ['Love', 'Like', 'Fine', 'Meh', 'Textbook']
@@ -77,100 +160,88 @@ def create_yearly_rating_plot(df, year):
     rating_count = rating_count.reindex(rating_order, fill_value=0)
     colors = [rating_colors.get(r, '#999999') for r in rating_count.index]
     
+    key = plot_cache_key("create_yearly_rating_plot", rating_count, year=year)
+    cached = cached_plot(key, in_memory)
+    if cached is not None:
+        return cached
+    
     plt.figure(figsize=(7, 5))
     plt.bar(rating_count.index, rating_count.values, color=colors)
     plt.title(f"Ratings Distribution in {year}")
     plt.xlabel("Rating")
     plt.ylabel("Number of Books")
-    plot_file = os.path.join(PLOTS_DIR, f"yearly_rating_{year}.png")
-    plt.savefig(plot_file, bbox_inches='tight')
-    plt.close()
-    return plot_file
+    return save_plot(key, in_memory)
 
-def create_yearly_monthly_trend_plot(df, year):
+@instrument.traced("plot.create_yearly_monthly_trend_plot")
+def create_yearly_monthly_trend_plot(aggregates, year, in_memory=False):
     """Bar chart of monthly reading trend for a specific year compared to previous year"""
-    # Get data for current year and previous year
-    df_current = df[df['time'].dt.year == year]
-    df_previous = df[df['time'].dt.year == year - 1]
-    
-    # Group by month for current year
-    monthly_current = (
-        df_current.groupby(df_current['time'].dt.month)['id']
-        .count()
-        .reindex(range(1, 13), fill_value=0)  # Ensure all 12 months exist
-        .reset_index(name='book_count')
-    )
-    monthly_current['year'] = year
-    monthly_current.rename(columns={'index': 'month'}, inplace=True)
-    
-    # Group by month for previous year
-    monthly_previous = (
-        df_previous.groupby(df_previous['time'].dt.month)['id']
-        .count()
-        .reindex(range(1, 13), fill_value=0)  # Ensure all 12 months exist
-        .reset_index(name='book_count')
-    )
-    monthly_previous['year'] = year - 1
-    monthly_previous.rename(columns={'index': 'month'}, inplace=True)
+    # Books per month for the previous and current year, side by side
+    monthly_combined = pd.concat([
+        pd.DataFrame({'month': range(1, 13), 'book_count': aggregates.monthly(y).values, 'year': y})
+        for y in (year - 1, year)
+    ], ignore_index=True)
     
-    # Combine both years
-    monthly_combined = pd.concat([monthly_previous, monthly_current], ignore_index=True)
+    key = plot_cache_key("create_yearly_monthly_trend_plot", monthly_combined, year=year)
+    cached = cached_plot(key, in_memory)
+    if cached is not None:
+        return cached
     
     # Create the plot
     plt.figure(figsize=(12, 6))
-    sns.barplot(data=monthly_combined, x='time', y='book_count', hue='year', palette=PALETTE)
+    sns.barplot(data=monthly_combined, x='month', y='book_count', hue='year', palette=PALETTE)
     plt.title(f"Monthly Reading Trend: {year-1} vs {year}")
     plt.xlabel("Month")
     plt.ylabel("Number of Books")
     plt.xticks(range(12), ['Jan', 'Feb', 'Mar', 'Apr', 'May', 'Jun', 
                             'Jul', 'Aug', 'Sep', 'Oct', 'Nov', 'Dec'])
     plt.legend(title='Year')
-    plot_file = os.path.join(PLOTS_DIR, f"yearly_monthly_{year}.png")
-    plt.savefig(plot_file, bbox_inches='tight')
-    plt.close()
-    return plot_file
+    return save_plot(key, in_memory)
 # ===== OVERALL SUMMARY PLOTS =====
 
-def create_overall_yearly_trend_plot(df):
+@instrument.traced("plot.create_overall_yearly_trend_plot")
+def create_overall_yearly_trend_plot(aggregates, in_memory=False):
     """Bar chart showing total books read per year"""
-    df_copy = df.copy()
-    df_copy['year'] = df_copy['time'].dt.year
-    
-    yearly_count = (
-        df_copy.groupby('year')['id']
-        .count()
-        .sort_index()
-        .reset_index(name='book_count')
-    )
+    yearly_count = aggregates.yearly().reset_index(name='book_count')
+    
+    key = plot_cache_key("create_overall_yearly_trend_plot", yearly_count)
+    cached = cached_plot(key, in_memory)
+    if cached is not None:
+        return cached
     
     plt.figure(figsize=(10, 6))
     sns.barplot(data=yearly_count, x='year', y='book_count', hue='year', palette=PALETTE)
     plt.title("Yearly Reading Trend")
     plt.xlabel("Year")
     plt.ylabel("Number of Books")
-    plot_file = os.path.join(PLOTS_DIR, "overall_yearly_trend.png")
-    plt.savefig(plot_file, bbox_inches='tight')
-    plt.close()
-    return plot_file
+    return save_plot(key, in_memory)
 
-def create_top_authors_plot(df):
+@instrument.traced("plot.create_top_authors_plot")
+def create_top_authors_plot(aggregates, in_memory=False):
     """Bar chart of top 5 authors"""
-    author_count = df['author'].value_counts().head(5)
+    author_count = aggregates.top_authors(5)
+    
+    key = plot_cache_key("create_top_authors_plot", author_count)
+    cached = cached_plot(key, in_memory)
+    if cached is not None:
+        return cached
     
     plt.figure(figsize=(8, 5))
     sns.barplot(x=author_count.values, y=author_count.index, hue=author_count.index, palette=PALETTE)
     plt.title("Top 5 Authors")
     plt.xlabel("Number of Books")
     plt.ylabel("Author")
-    plot_file = os.path.join(PLOTS_DIR, "top_authors.png")
-    plt.savefig(plot_file, bbox_inches='tight')
-    plt.close()
-    return plot_file
+    return save_plot(key, in_memory)
 
-def create_overall_rating_plot(df):
+@instrument.traced("plot.create_overall_rating_plot")
+def create_overall_rating_plot(aggregates, in_memory=False):
     """Pie chart of overall ratings distribution"""
-    rating_count = df['rating'].value_counts()
+    rating_count = aggregates.ratings()
 
+    key = plot_cache_key("create_overall_rating_plot", rating_count)
+    cached = cached_plot(key, in_memory)
+    if cached is not None:
+        return cached
+    
     plt.figure(figsize=(6, 6))
     plt.pie(
         rating_count,
@@ -180,14 +251,17 @@ def create_overall_rating_plot(df):
         colors=sns.color_palette("Set2", n_colors=len(rating_count))
     )
     plt.title("Overall Ratings Distribution")
-    plot_file = os.path.join(PLOTS_DIR, "overall_rating.png")
-    plt.savefig(plot_file, bbox_inches='tight')
-    plt.close()
-    return plot_file
+    return save_plot(key, in_memory)
 
-def create_overall_language_plot(df):
+@instrument.traced("plot.create_overall_language_plot")
+def create_overall_language_plot(aggregates, in_memory=False):
     """Pie chart of overall languages distribution"""
-    lang_count = df['lang'].value_counts()
+    lang_count = aggregates.languages()
+    
+    key = plot_cache_key("create_overall_language_plot", lang_count)
+    cached = cached_plot(key, in_memory)
+    if cached is not None:
+        return cached
     
     plt.figure(figsize=(6, 6))
     plt.pie(
@@ -198,7 +272,4 @@ def create_overall_language_plot(df):
         colors=sns.color_palette("Set2", n_colors=len(lang_count))
     )
     plt.title("Overall Languages Read")
-    plot_file = os.path.join(PLOTS_DIR, "overall_language.png")
-    plt.savefig(plot_file, bbox_inches='tight')
-    plt.close()
-    return plot_file
+    return save_plot(key, in_memory)
@@ -1,15 +1,32 @@
 import os
 import sys
+import atexit
+import itertools
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
 from fpdf import FPDF, XPos, YPos
 import pandas as pd
 from datetime import datetime
 from reporting import plot
+from reporting.aggregates import ReportAggregates
+from utils import instrument
 
 # Set font to support Chinese characters
 import matplotlib
 matplotlib.rc('font', family='Microsoft YaHei') 
 
 START_YEAR = 2019
+# Books read before this month (YYYY-MM) are left out of the report
+DATA_SINCE = "2020-01"
+# Where the report's counts are computed: "sql" groups in SQLite (database.get_report_counts),
+# "pandas" loads every book and groups in a DataFrame
+REPORT_BACKEND = "sql"
+
+# Processes used to draw report plots; 1 draws them one after another in this process
+PLOT_WORKERS = min(4, os.cpu_count() or 1)
+# Hand plots to FPDF as in-memory PNGs instead of paths to read back from disk
+IN_MEMORY_IMAGES = True
 
 def get_base_dir():
     # Running as a bundled executable
@@ -22,16 +39,27 @@ def get_base_dir():
 BASE_DIR = get_base_dir()
 PLOTS_DIR = os.path.join(BASE_DIR, "plots")
 REPORTS_DIR = os.path.join(BASE_DIR, "reports")
-os.makedirs(PLOTS_DIR, exist_ok=True)
-os.makedirs(REPORTS_DIR, exist_ok=True)
+
+# Columns of prepare_data's frame stored as categoricals; each holds a handful of distinct values
+CATEGORY_COLUMNS = ["author", "lang", "orig_lang", "genre", "rating"]
 
 def prepare_data(books):
-    # Prepare dataframe for visualization
+    """Compact frame of the books the report covers.
+
+    year (int16) and month (int8) are sliced from the YYYY-MM time string, so a book
+    with an unknown month ("YYYY-00") keeps month 0; text columns are categoricals and
+    the columns the report never reads (id, title, note) are dropped.
+    """
     columns = ["id", "title", "author", "time", "lang", "orig_lang", "genre", "rating", "note"]
     df = pd.DataFrame(books, columns=columns)
-    df = df[df['time']>='2020-01']
-    df['time'] = pd.to_datetime(df['time'], format='%Y-%m').dt.to_period('M')
-    return df
+    df = df[df['time']>=DATA_SINCE]
+    data = {
+        "year": df["time"].str.slice(0, 4).astype("int16"),
+        "month": df["time"].str.slice(5, 7).astype("int8"),
+    }
+    for column in CATEGORY_COLUMNS:
+        data[column] = df[column].astype("category")
+    return pd.DataFrame(data).reset_index(drop=True)
 
 # Create pdf template
 class PDFReport(FPDF):
@@ -64,17 +92,152 @@ class PDFReport(FPDF):
         self.multi_cell(0, 8, text)
         self.ln(5)
 
-    def add_image(self, image_path, w=180):
-        self.image(image_path, x=(210 - w) / 2, w=w)
+    def add_image(self, image, w=180):
+        """image is a file path or a BytesIO holding the image."""
+        self.image(image, x=(210 - w) / 2, w=w)
         self.ln(10)
 
-def generate_report(books, output_file="report.pdf"):
-    """Generate complete PDF report with yearly and overall summaries"""
+class ReportCancelled(Exception):
+    pass
+
+def check_cancelled(cancel_event):
+    """Stop a report between steps once cancel_event (a threading.Event) is set."""
+    if cancel_event is not None and cancel_event.is_set():
+        raise ReportCancelled("Report generation was cancelled.")
+
+def render_plot(name, args, kwargs=None):
+    """Draw one plot by its function name in reporting.plot. Runs in a worker process."""
+    return getattr(plot, name)(*args, **(kwargs or {}))
+
+def render_plot_in_worker(name, args, kwargs=None):
+    """render_plot for a pool process; also returns the instrument events recorded there."""
+    instrument.drain()  # Drop events left from starting up or from an earlier job
+    return render_plot(name, args, kwargs), instrument.drain()
+
+def init_plot_worker(cache_dir):
+    """Pool initializer: a spawned process imports plot afresh, so hand it the cache directory."""
+    plot.PLOT_CACHE_DIR = cache_dir
+
+_pool = None
+_pool_workers = 0
+_pool_cache_dir = None
+
+def get_pool(workers):
+    """Return the shared process pool, started on first use and kept for later reports.
+
+    Worker processes import pandas and matplotlib once, so only the first report pays for it.
+    They are spawned rather than forked: the pool is started from a worker thread while
+    Tk runs, and forking a multi-threaded process can deadlock the child. The pool is
+    restarted if plot.PLOT_CACHE_DIR has changed since its workers started.
+    """
+    global _pool, _pool_workers, _pool_cache_dir
+    if _pool is None or _pool_workers != workers or _pool_cache_dir != plot.PLOT_CACHE_DIR:
+        shutdown_pool()
+        _pool = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"),
+                                    initializer=init_plot_worker, initargs=(plot.PLOT_CACHE_DIR,))
+        _pool_workers, _pool_cache_dir = workers, plot.PLOT_CACHE_DIR
+    return _pool
+
+def shutdown_pool():
+    global _pool, _pool_workers, _pool_cache_dir
+    if _pool is not None:
+        _pool.shutdown(wait=False, cancel_futures=True)
+        _pool, _pool_workers, _pool_cache_dir = None, 0, None
+
+atexit.register(shutdown_pool)
+
+def render_plots(jobs, workers=None, cancel_event=None):
+    """Draw the (function name, args, kwargs) plot jobs and return their outputs in job order.
+
+    With more than one worker the figures are drawn concurrently in a process pool
+    (each process uses the Agg backend). workers=1, or a pool that cannot start, draws
+    them one after another in this process.
+    """
+    if workers is None:
+        workers = PLOT_WORKERS
+    workers = min(workers, len(jobs))
+
+    if workers > 1:
+        try:
+            futures = [get_pool(workers).submit(render_plot_in_worker, *job) for job in jobs]
+        except (OSError, RuntimeError, BrokenProcessPool):
+            shutdown_pool()
+        else:
+            try:
+                outputs = []
+                for future in futures:
+                    check_cancelled(cancel_event)
+                    output, events = future.result()
+                    instrument.extend(events)
+                    outputs.append(output)
+                return outputs
+            except ReportCancelled:
+                for future in futures:
+                    future.cancel()
+                raise
+            except BrokenProcessPool:
+                # A worker died; start afresh next time and finish this report serially
+                shutdown_pool()
+
+    outputs = []
+    for job in jobs:
+        check_cancelled(cancel_event)
+        outputs.append(render_plot(*job))
+    return outputs
+
+def report_path():
+    """Claim a new, unique report file name in REPORTS_DIR."""
+    os.makedirs(REPORTS_DIR, exist_ok=True)
+    timestamp = datetime.now().strftime("%Y%m%d-%H%M%S")
+    for n in itertools.count():
+        output_file = f"report_{timestamp}.pdf" if n == 0 else f"report_{timestamp}-{n}.pdf"
+        output_path = os.path.join(REPORTS_DIR, output_file)
+        try:
+            # Exclusive create, so two reports started in the same second get different files
+            with open(output_path, "x"):
+                return output_path
+        except FileExistsError:
+            continue
+
+@instrument.traced("report.generate_report")
+def generate_report(books=None, output_file="report.pdf", cancel_event=None, workers=None, in_memory=None,
+                    counts=None):
+    """Generate complete PDF report with yearly and overall summaries
+
+    Pass either books (rows of the books table, grouped with pandas) or counts (the
+    result of database.get_report_counts, already grouped in SQLite).
+    workers sets how many processes draw the plots; see render_plots.
+    in_memory passes plot images to FPDF as BytesIO buffers (default IN_MEMORY_IMAGES).
+    """
+    if in_memory is None:
+        in_memory = IN_MEMORY_IMAGES
     pdf = PDFReport()
-    df = prepare_data(books)
+    if counts is not None:
+        aggregates = ReportAggregates.from_counts(counts["counts"], counts["authors"])
+    else:
+        aggregates = ReportAggregates.from_frame(prepare_data(books))
     
     current_year = datetime.now().year
-    books_this_year = len(df[df['time'].dt.year == current_year])
+    books_this_year = aggregates.total(current_year)
+
+    # The plots do not depend on each other, so draw them all up front (possibly in
+    # parallel) and place them in the PDF afterwards in this order, with these widths
+    plot_jobs = [
+        # Yearly plots
+        ("create_yearly_language_plot", (aggregates, current_year), 120),
+        ("create_yearly_genre_plot", (aggregates, current_year), 150),
+        ("create_yearly_rating_plot", (aggregates, current_year), 140),
+        ("create_yearly_monthly_trend_plot", (aggregates, current_year), 170),
+        # Overall plots
+        ("create_overall_yearly_trend_plot", (aggregates,), 170),
+        ("create_top_authors_plot", (aggregates,), 150),
+        ("create_overall_rating_plot", (aggregates,), 120),
+        ("create_overall_language_plot", (aggregates,), 120),
+    ]
+    images = render_plots(
+        [(name, args, {"in_memory": in_memory}) for name, args, _ in plot_jobs], workers, cancel_event
+    )
+    widths = [width for _, _, width in plot_jobs]
     
     # ===== YEARLY SUMMARY =====
     pdf.add_page()
@@ -83,48 +246,26 @@ def generate_report(books, output_file="report.pdf"):
         f"You have read {books_this_year} books this year! "
         f"Here are the breakdowns."
     )
-    
-    # Yearly plots
-    # Plot 1: Language Distribution
-    lang_plot = plot.create_yearly_language_plot(df, current_year)
-    pdf.add_image(lang_plot, w=120)
-    # Plot 2: Genre Distribution
-    genre_plot = plot.create_yearly_genre_plot(df, current_year)
-    pdf.add_image(genre_plot, w=150)
-    # Plot 3: Rating Distribution
-    rating_plot = plot.create_yearly_rating_plot(df, current_year)
-    pdf.add_image(rating_plot, w=140)
-    # Plot 4: Monthly Trend
-    monthly_plot = plot.create_yearly_monthly_trend_plot(df, current_year)
-    pdf.add_image(monthly_plot, w=170)
+    for image, width in zip(images[:4], widths[:4]):
+        pdf.add_image(image, w=width)
     
     # ===== OVERALL SUMMARY =====
     pdf.add_page()
     pdf.add_section_title("Overall Summary")
     pdf.add_paragraph(
-        f"Since {START_YEAR}, you've read {len(df)} books. "
+        f"Since {START_YEAR}, you've read {aggregates.total()} books. "
         f"Here's your overall reading journey."
     )
+    for image, width in zip(images[4:], widths[4:]):
+        pdf.add_image(image, w=width)
     
-    # Overall plots
-    # Plot 1: Yearly Trend
-    yearly_trend = plot.create_overall_yearly_trend_plot(df)
-    pdf.add_image(yearly_trend, w=170)
-    # Plot 2: Top Authors
-    top_authors = plot.create_top_authors_plot(df)
-    pdf.add_image(top_authors, w=150)
-    # Plot 3: Overall Ratings
-    overall_rating = plot.create_overall_rating_plot(df)
-    pdf.add_image(overall_rating, w=120)
-    # Plot 4: Overall Languages
-    overall_lang = plot.create_overall_language_plot(df)
-    pdf.add_image(overall_lang, w=120)
-    
+    check_cancelled(cancel_event)
     # Save PDF
-    timestamp = datetime.now().strftime("%Y%m%d-%H%M%S")
-    output_file = f"report_{timestamp}.pdf"
-    output_path = os.path.join(REPORTS_DIR, output_file)
+    output_path = report_path()
     pdf.output(output_path)
+
+    # Keep the plot cache bounded; done here so no plot is removed while a report still needs it
+    plot.prune_plot_cache()
     
     return output_path
     
@@ -0,0 +1,25 @@
+# Values the forms offer, shared by the GUI, the importers and validation
+
+GENRES = [
+    'Economics', 'Fiction', 'Finance', 'History', 'Linguistics',
+    'Marketing', 'Mathematics', 'Memoir', 'News Magazine',
+    'Philosophy', 'Psychology', 'Science', 'Self-Help',
+    'Short Story', 'Sociology', 'Soft Skill', 'Travel', 'Urban Design',
+    'Others'
+]
+
+LANGUAGES = [
+    'English', 'Chinese', 'French', 'Japanese','Korean', 'Russian',
+    'German', 'Hebrew', 'Spanish','Dutch', 'Swedish','Others'
+]
+
+RATINGS = ['Love', 'Like', 'Fine', 'Meh', 'Textbook']
+
+TYPES = [
+    'Anime',
+    'Cartoon',
+    'Comedy',          # Covers sitcoms, stand-up, comedy series
+    'Drama',
+    'Documentary',
+    'Others'
+]
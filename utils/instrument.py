@@ -0,0 +1,149 @@
+"""Lightweight timing of hot paths.
+
+Functions decorated with traced(name) record their wall time, the rows they returned
+and the bytes they wrote into an in-process ring buffer, and optionally append each
+event to a JSONL file. summary() gives per-operation percentiles for the Diagnostics
+window.
+
+MYMEDIA_TRACE=0 turns tracing off before anything is decorated, so decorated functions
+are returned untouched and cost nothing. set_enabled(False) turns it off at run time,
+leaving one flag check per call. MYMEDIA_TRACE_FILE=path starts the JSONL sink.
+"""
+import os
+import json
+import time
+import threading
+import functools
+from io import BytesIO
+from collections import deque
+
+ENABLED = os.environ.get("MYMEDIA_TRACE", "1") != "0"
+RING_SIZE = 5000  # Most recent events kept in memory
+
+_events = deque(maxlen=RING_SIZE)
+_sink = None
+_sink_lock = threading.Lock()
+
+
+def set_enabled(enabled):
+    """Turn recording on or off for functions decorated while tracing was enabled."""
+    global ENABLED
+    ENABLED = enabled
+
+def set_sink(path):
+    """Append every event to the JSONL file path from now on; None stops writing."""
+    global _sink
+    with _sink_lock:
+        if _sink is not None:
+            _sink.close()
+        _sink = open(path, "a", encoding="utf-8") if path else None
+
+def measure(result):
+    """Rows and bytes for a traced result: lists and tuples count rows, buffers and file paths bytes."""
+    if isinstance(result, (list, tuple)):
+        return len(result), None
+    if isinstance(result, BytesIO):
+        return None, result.getbuffer().nbytes
+    if isinstance(result, str) and os.path.isfile(result):
+        return None, os.path.getsize(result)
+    return None, None
+
+def record(name, ms, rows=None, nbytes=None, error=None):
+    """Add one event, e.g. for work timed by hand rather than through traced."""
+    if not ENABLED:
+        return
+    event = {
+        "name": name,
+        "at": time.time(),
+        "ms": ms,
+        "rows": rows,
+        "bytes": nbytes,
+        "error": error,
+        "thread": threading.current_thread().name,
+    }
+    _add(event)
+
+def _add(event):
+    _events.append(event)
+    if _sink is not None:
+        with _sink_lock:
+            if _sink is not None:
+                _sink.write(json.dumps(event, ensure_ascii=False) + "\n")
+                _sink.flush()
+
+def traced(name, measure=measure):
+    """Decorator recording each call of the function as an event called name.
+
+    measure(result) returns the (rows, bytes) to record for a result.
+    """
+    def decorate(fn):
+        if not ENABLED:
+            return fn
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            if not ENABLED:
+                return fn(*args, **kwargs)
+            start = time.perf_counter()
+            try:
+                result = fn(*args, **kwargs)
+            except BaseException as e:
+                record(name, (time.perf_counter() - start) * 1000, error=type(e).__name__)
+                raise
+            ms = (time.perf_counter() - start) * 1000
+            rows, nbytes = measure(result)
+            record(name, ms, rows, nbytes)
+            return result
+        return wrapper
+    return decorate
+
+def events():
+    """A snapshot of the recorded events, oldest first."""
+    return list(_events)
+
+def drain():
+    """Remove and return the recorded events; used to send a worker process's events back."""
+    drained = []
+    while True:
+        try:
+            drained.append(_events.popleft())
+        except IndexError:
+            return drained
+
+def extend(new_events):
+    """Add events recorded elsewhere, e.g. those drain()ed in a plot worker process."""
+    for event in new_events:
+        _add(event)
+
+def clear():
+    _events.clear()
+
+def percentile(sorted_values, fraction):
+    """Nearest-rank percentile of an already sorted list."""
+    index = min(len(sorted_values) - 1, max(0, round(fraction * len(sorted_values)) - 1))
+    return sorted_values[index]
+
+def summary():
+    """Per operation: count, errors, p50/p90/p99/max milliseconds, average rows and total bytes."""
+    by_name = {}
+    for event in events():
+        by_name.setdefault(event["name"], []).append(event)
+
+    stats = {}
+    for name, group in sorted(by_name.items()):
+        times = sorted(event["ms"] for event in group)
+        rows = [event["rows"] for event in group if event["rows"] is not None]
+        stats[name] = {
+            "count": len(group),
+            "errors": sum(1 for event in group if event["error"]),
+            "p50": percentile(times, 0.5),
+            "p90": percentile(times, 0.9),
+            "p99": percentile(times, 0.99),
+            "max": times[-1],
+            "rows": sum(rows) / len(rows) if rows else None,
+            "bytes": sum(event["bytes"] or 0 for event in group),
+        }
+    return stats
+
+if os.environ.get("MYMEDIA_TRACE_FILE"):
+    set_sink(os.environ["MYMEDIA_TRACE_FILE"])
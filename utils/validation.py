@@ -1,3 +1,5 @@
+from utils.constants import GENRES, LANGUAGES, RATINGS, TYPES
+
 def is_empty(input):
     return input.strip() == ""
 
@@ -29,6 +31,83 @@ def check_season(input, accept_empty=False):
     return False
 
 
+# Whole-column validation for bulk imports. A rule is "required", one of the
+# number or time checks below (which accept empty values), or a list of choices.
+NUMBER_RANGES = {
+    "id": (1, None),
+    "year": (1, 2100),
+    "month": (0, 12),  # 0 or 00 is an unknown month, as saved by the forms
+    "season": (1, None),
+}
+TIME_PATTERN = r"(\d+)(?:-(\d+))?"  # YYYY or YYYY-MM
+
+BOOK_RULES = {
+    "id": "id", "title": "required", "author": "required", "time": "time",
+    "year": "year", "month": "month", "language": LANGUAGES,
+    "original_language": LANGUAGES, "genre": GENRES, "rating": RATINGS,
+}
+SHOW_RULES = {
+    "id": "id", "title": "required", "season": "season", "time": "time",
+    "year": "year", "month": "month", "type": TYPES,
+}
+
+def _in_range(numbers, rule):
+    low, high = NUMBER_RANGES[rule]
+    return numbers.ge(low) & (numbers.le(high) if high is not None else True)
+
+def validate_frame(df, rules):
+    """Check every column of df that has a rule, a whole column at a time.
+
+    Each distinct value is checked once and the result spread back over the rows,
+    so columns of choices cost little however long df is. Returns a DataFrame with
+    one row per problem: the row label in df, the field, its value and the error,
+    ordered by row. An empty result means df is valid.
+    """
+    import pandas as pd  # Only bulk imports need pandas here
+
+    problems = [pd.DataFrame({"row": df.index[:0], "field": [], "value": [], "error": []}, dtype=object)]
+    for field, rule in rules.items():
+        if field not in df.columns:
+            continue
+        codes, uniques = pd.factorize(df[field].fillna(""))
+        values = pd.Series(uniques, dtype=object).str.strip()
+        empty = values.eq("")
+        checks = []
+        if rule == "required" or isinstance(rule, (list, tuple, set)):
+            checks.append((empty, "is empty"))
+            if rule != "required":
+                checks.append((~empty & ~values.isin(rule), "is not one of the choices"))
+        elif rule in NUMBER_RANGES:
+            # isdigit like check_year, so the same values pass both ways
+            numbers = pd.to_numeric(values.where(values.str.isdigit()), errors="coerce")
+            checks.append((~empty & ~_in_range(numbers, rule), f"is not a valid {rule}"))
+        elif rule == "time":
+            parts = values.str.extract(f"^{TIME_PATTERN}$")
+            years = pd.to_numeric(parts[0], errors="coerce")
+            months = pd.to_numeric(parts[1], errors="coerce").fillna(0)
+            valid = _in_range(years, "year") & _in_range(months, "month")
+            checks.append((~empty & ~valid, "is not a valid time (YYYY or YYYY-MM)"))
+        else:
+            raise ValueError(f"Unknown validation rule for {field}: {rule!r}")
+
+        for bad_values, error in checks:
+            if bad_values.any():
+                bad = bad_values.to_numpy()[codes]
+                problems.append(pd.DataFrame({"row": df.index[bad], "field": field,
+                                              "value": values.to_numpy()[codes[bad]], "error": error}))
+
+    return pd.concat(problems, ignore_index=True).sort_values("row", kind="stable", ignore_index=True)
+
+def summarize_errors(errors, limit = 10):
+    """A message listing the first limit problems from validate_frame."""
+    lines = [f"Row {row}: {field} {repr(value) + ' ' if value else ''}{error}" for row, field, value, error
+             in errors.head(limit).itertuples(index=False)]
+    if len(errors) > limit:
+        lines.append(f"... and {len(errors) - limit} more problems")
+    rows = errors["row"].nunique()
+    return f"{len(errors)} problems in {rows} rows:\n" + "\n".join(lines)
+
+
 def main():
     print(check_season("2", accept_empty=True))
 